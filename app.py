@@ -1,10 +1,8 @@
+import uuid
+from datetime import datetime
 import streamlit as st
-import pandas as pd
-from main import create_graph, memory, visualize_graph
-import json
-from pathlib import Path
-import time
-import plotly.graph_objects as go
+from main import get_app, get_memory, stream_query, make_initial_state
+from graph_visualizer import graph_image
 
 # Page configuration
 st.set_page_config(
@@ -34,19 +32,33 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Initialize session state
-if 'app' not in st.session_state:
-    st.session_state.app = create_graph()
+# The compiled graph is shared by every session in this process
+@st.cache_resource
+def load_app():
+    return get_app()
 
 
-def load_conversation_history():
-    """Load conversation history from memory.json"""
-    memory_file = Path("memory.json")
-    if memory_file.exists():
-        with open(memory_file, 'r') as f:
-            data = json.load(f)
-            return data.get("conversations", [])
-    return []
+def get_session_id():
+    """Memory shard for this browser session; ?session=<id> resumes an earlier one"""
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = st.query_params.get("session") or uuid.uuid4().hex
+    return st.session_state.session_id
+
+
+# Only one page of history is fetched per rerun; the memory version is part
+# of the cache key, so a page is reused until a conversation is added
+@st.cache_data(max_entries=64)
+def load_history_page(session_id, version, cursor, limit, route):
+    """Load one page of conversation history from the session's memory shard"""
+    return get_memory(session_id).get_history(cursor=cursor, limit=limit, route=route)
+
+
+def format_timestamp(timestamp):
+    """Render an ISO timestamp for display"""
+    try:
+        return datetime.fromisoformat(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+    except (TypeError, ValueError):
+        return timestamp or ""
 
 
 def display_status(message, status_type="info"):
@@ -76,8 +88,7 @@ def main():
         st.markdown("---")
 
         # Display conversation count
-        conversations = load_conversation_history()
-        st.metric("Total Conversations", len(conversations))
+        st.metric("Total Conversations", len(get_memory(get_session_id()).conversations))
 
         # Display system status
         st.subheader("System Status")
@@ -87,8 +98,9 @@ def main():
 
         # Display graph visualization
         st.subheader("System Architecture")
-        visualize_graph("graph_structure.png")
-        st.image("graph_structure.png", use_column_width=True)
+        image = graph_image(load_app())
+        if image:
+            st.image(image, use_column_width=True)
 
     # Main content area - split into tabs
     tab1, tab2 = st.tabs(["Chat Interface", "Conversation History"])
@@ -105,21 +117,23 @@ def main():
                     # Show processing status
                     with st.spinner("Processing your query..."):
                         # Initialize state
-                        initial_state = {
-                            "input": user_input,
-                            "route": "",
-                            "sub_routes": [],
-                            "math_result": "",
-                            "story": "",
-                            "translation": "",
-                            "target_language": "",
-                            "default_result": "",
-                            "memory_context": "",
-                            "final_output": ""
-                        }
-
-                        # Process the query
-                        result = st.session_state.app.invoke(initial_state)
+                        initial_state = make_initial_state(user_input, get_session_id())
+
+                        # Process the query, rendering tokens as each node streams them
+                        result = initial_state
+                        placeholders = {}
+                        streamed = {}
+                        for kind, payload in stream_query(load_app(), initial_state):
+                            if kind == "result":
+                                result = payload
+                                continue
+                            node = payload['node']
+                            if node not in placeholders:
+                                st.caption(f"⏳ {node}")
+                                placeholders[node] = st.empty()
+                                streamed[node] = ""
+                            streamed[node] += payload['token']
+                            placeholders[node].markdown(streamed[node])
 
                         # Display results
                         st.markdown("### Processing Results")
@@ -135,6 +149,21 @@ def main():
                             with st.expander("🧠 Memory Context"):
                                 st.markdown(result['memory_context'])
 
+                        # Display per-node timings collected during the run
+                        if result.get('trace'):
+                            with st.expander("⏱️ Timings"):
+                                for entry in result['trace']:
+                                    details = f"- **{entry['span']}** {entry['node']}: {entry['duration_ms']:.1f} ms"
+                                    if 'ttft_ms' in entry:
+                                        details += f" (first token after {entry['ttft_ms']:.1f} ms)"
+                                    if 'tokens' in entry:
+                                        details += f", {entry['tokens']} tokens"
+                                    if 'prefill_ms' in entry:
+                                        details += f", prefill {entry['prefill_ms']:.1f} ms for {entry['prompt_tokens']} prompt tokens"
+                                    if entry.get('kv_reuse'):
+                                        details += f" (reused {entry['prefill_saved_tokens']} cached context tokens)"
+                                    st.markdown(details)
+
                         # Display final output
                         st.markdown("### Output")
                         st.markdown('<div class="output-box">', unsafe_allow_html=True)
@@ -150,28 +179,44 @@ def main():
 
     # Tab 2 - Conversation History
     with tab2:
-        conversations = load_conversation_history()
-
-        if conversations:
-            # Convert to DataFrame for better display
-            df = pd.DataFrame(conversations)
-
-            # Format timestamp
-            df['timestamp'] = pd.to_datetime(df['timestamp']).dt.strftime('%Y-%m-%d %H:%M:%S')
-
-            # Create an expander for each conversation
-            for idx, row in df.iloc[::-1].iterrows():
-                with st.expander(f"🗣️ {row['query'][:50]}... ({row['timestamp']})"):
-                    st.markdown(f"**Query:** {row['query']}")
-                    st.markdown(f"**Route:** {row['route']}")
-                    if row['metadata']:
+        memory = get_memory(get_session_id())
+
+        if memory.conversations:
+            filter_col, size_col = st.columns(2)
+            route = filter_col.selectbox("Route", ["all"] + sorted(memory.conversations.route_counts))
+            page_size = size_col.selectbox("Conversations per page", [10, 20, 50], index=1)
+
+            # Cursors of the pages visited so far; start over when the filters change
+            filters = (route, page_size)
+            if st.session_state.get("history_filters") != filters:
+                st.session_state.history_filters = filters
+                st.session_state.history_cursors = [None]
+            cursors = st.session_state.history_cursors
+
+            page = load_history_page(memory.session_id, memory.version, cursors[-1], page_size,
+                                     None if route == "all" else route)
+
+            # Create an expander for each conversation on this page
+            for conv in page['conversations']:
+                with st.expander(f"🗣️ {conv['query'][:50]}... ({format_timestamp(conv['timestamp'])})"):
+                    st.markdown(f"**Query:** {conv['query']}")
+                    st.markdown(f"**Route:** {conv['route']}")
+                    if conv['metadata']:
                         st.markdown("**Processing Details:**")
-                        for key, value in row['metadata'].items():
+                        for key, value in conv['metadata'].items():
                             st.markdown(f"- {key}: {value}")
                     st.markdown("**Response:**")
                     st.markdown('<div class="output-box">', unsafe_allow_html=True)
-                    st.markdown(row['response'])
+                    st.markdown(conv['response'])
                     st.markdown('</div>', unsafe_allow_html=True)
+
+            newer_col, older_col = st.columns(2)
+            if len(cursors) > 1 and newer_col.button("← Newer"):
+                cursors.pop()
+                st.rerun()
+            if page['next_cursor'] is not None and older_col.button("Older →"):
+                cursors.append(page['next_cursor'])
+                st.rerun()
         else:
             st.info("No conversation history available yet.")
 
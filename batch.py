@@ -0,0 +1,134 @@
+import argparse
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Any, List, Iterator, Tuple
+from main import get_app, make_initial_state, run_query
+from metrics import registry
+from logger_config import setup_logging
+
+logger = setup_logging()
+
+
+def read_queries(path: Path) -> Iterator[Tuple[int, str]]:
+    """Yield (line index, query) pairs from a JSONL file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for index, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping invalid JSON on line {index + 1}")
+                continue
+            if isinstance(record, str):
+                yield index, record
+            elif isinstance(record, dict):
+                query = record.get('query') or record.get('input') or record.get('body')
+                if query:
+                    yield index, query
+                else:
+                    logger.warning(f"Skipping line {index + 1}: no 'query' or 'input' field")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def run_one(app, index: int, query: str) -> Dict[str, Any]:
+    """Run a single query through the graph and time it"""
+    start = time.perf_counter()
+    try:
+        result = run_query(app, make_initial_state(query))
+        record = {
+            "index": index,
+            "query": query,
+            "route": result.get('route'),
+            "sub_routes": result.get('sub_routes', []),
+            "final_output": result.get('final_output', ''),
+            "error": None
+        }
+    except Exception as e:
+        logger.error(f"Batch query {index} failed: {e}")
+        record = {"index": index, "query": query, "route": "error", "sub_routes": [],
+                  "final_output": "", "error": str(e)}
+    record["latency_ms"] = (time.perf_counter() - start) * 1000
+    return record
+
+
+def run_batch(input_path: Path, output_path: Path, concurrency: int = 4) -> Dict[str, Any]:
+    """Run every query in a JSONL file through the graph and write JSONL results"""
+    app = get_app()
+    queries = list(read_queries(input_path))
+    latencies: Dict[str, List[float]] = {}
+    errors = 0
+
+    logger.info(f"Running {len(queries)} queries with concurrency {concurrency}")
+    start = time.perf_counter()
+
+    with open(output_path, 'w', encoding='utf-8') as out, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as executor:
+        futures = [executor.submit(run_one, app, index, query) for index, query in queries]
+        for future in as_completed(futures):
+            record = future.result()
+            latencies.setdefault(record['route'], []).append(record['latency_ms'])
+            if record['error']:
+                errors += 1
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    elapsed = time.perf_counter() - start
+    return {
+        "queries": len(queries),
+        "errors": errors,
+        "elapsed_seconds": elapsed,
+        "throughput_qps": len(queries) / elapsed if elapsed else 0.0,
+        "route_latency_ms": {
+            route: {
+                "count": len(values),
+                "mean": sum(values) / len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "max": max(values)
+            }
+            for route, values in sorted(latencies.items())
+        }
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    """Print a human readable throughput and latency summary"""
+    print(f"\n📊 Processed {report['queries']} queries in {report['elapsed_seconds']:.2f}s "
+          f"({report['throughput_qps']:.2f} queries/s, {report['errors']} errors)")
+    print(f"{'route':<12}{'count':>8}{'mean ms':>12}{'p50 ms':>12}{'p95 ms':>12}{'max ms':>12}")
+    for route, stats in report['route_latency_ms'].items():
+        print(f"{route:<12}{stats['count']:>8}{stats['mean']:>12.1f}{stats['p50']:>12.1f}"
+              f"{stats['p95']:>12.1f}{stats['max']:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of queries through the router graph")
+    parser.add_argument("input", type=Path, help="JSONL file with one query per line")
+    parser.add_argument("-o", "--output", type=Path, help="Where to write JSONL results")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Number of queries in flight")
+    parser.add_argument("--metrics", type=Path, help="Write Prometheus span metrics to this file")
+    args = parser.parse_args()
+
+    output = args.output or args.input.with_suffix(".results.jsonl")
+    report = run_batch(args.input, output, args.concurrency)
+    print_report(report)
+    print(f"📝 Results written to '{output}'")
+    if args.metrics:
+        registry.write_prometheus(str(args.metrics))
+        print(f"📈 Metrics written to '{args.metrics}'")
+
+
+if __name__ == "__main__":
+    main()
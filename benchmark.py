@@ -0,0 +1,130 @@
+import argparse
+import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List
+import main
+from batch import percentile
+from llm_backends import FakeLLM, set_llm
+from memory_manager import Memory
+from logger_config import setup_logging
+
+logger = setup_logging()
+
+# One representative query per route
+ROUTE_QUERIES = {
+    "math": "What is 15 * 3",
+    "write": "Write a poem about summer",
+    "translate": 'Translate "good morning" to French',
+    "multi": "Calculate 15 * 3 and translate the result to Spanish",
+    "default": "How are you today?",
+}
+
+
+def make_memory(size: int, directory: Path) -> Memory:
+    """Build a throwaway memory store pre-filled with synthetic conversations"""
+    mem = Memory(memory_file=str(directory / f"memory_{size}.json"), fsync_policy="never",
+                 capacity=max(size, 1) + 1000)
+    for i in range(size):
+        query = list(ROUTE_QUERIES.values())[i % len(ROUTE_QUERIES)]
+        mem._store({
+            "timestamp": "2024-01-01T00:00:00",
+            "query": f"{query} #{i}",
+            "response": f"Synthetic response {i} about {query.lower()}",
+            "route": list(ROUTE_QUERIES)[i % len(ROUTE_QUERIES)],
+            "metadata": {}
+        })
+    return mem
+
+
+def run_case(app, query: str, requests: int, concurrency: int) -> Dict[str, Any]:
+    """Send the same query through the graph and measure latency and throughput"""
+    def one(_):
+        start = time.perf_counter()
+        main.run_query(app, main.make_initial_state(query))
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "throughput_qps": requests / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+def run_benchmarks(routes: List[str], memory_sizes: List[int], concurrency_levels: List[int],
+                   requests: int, llm: FakeLLM, use_cache: bool = False,
+                   use_coalescing: bool = False) -> List[Dict[str, Any]]:
+    """Benchmark every route x memory size x concurrency combination
+
+    Every case sends the same query concurrently, so request coalescing is
+    off unless asked for; otherwise it would measure deduplication rather
+    than the graph.
+    """
+    set_llm(llm)
+    main.LLM_CACHE_ENABLED = use_cache
+    main.COALESCE_REQUESTS = use_coalescing
+    app = main.create_graph()
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in memory_sizes:
+            main.set_memory(make_memory(size, Path(tmp)))
+            for route in routes:
+                for concurrency in concurrency_levels:
+                    result = run_case(app, ROUTE_QUERIES[route], requests, concurrency)
+                    result.update({"route": route, "memory_size": size, "concurrency": concurrency})
+                    results.append(result)
+                    logger.info(f"Benchmark {route} memory={size} concurrency={concurrency}: "
+                                f"p50={result['p50_ms']:.1f}ms p99={result['p99_ms']:.1f}ms")
+            main.get_memory().flush()
+
+    return results
+
+
+def print_results(results: List[Dict[str, Any]]):
+    """Print benchmark results as a table"""
+    print(f"{'route':<10}{'memory':>8}{'conc':>6}{'qps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for r in results:
+        print(f"{r['route']:<10}{r['memory_size']:>8}{r['concurrency']:>6}{r['throughput_qps']:>10.1f}"
+              f"{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}")
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark the router graph against a fake LLM backend")
+    parser.add_argument("--routes", default=",".join(ROUTE_QUERIES), help="Comma separated routes to run")
+    parser.add_argument("--memory-sizes", type=_int_list, default=[0, 1000, 10000])
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=50, help="Requests per combination")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake time to first token (s)")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Fake tokens per second, 0 = instant")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--with-cache", action="store_true", help="Keep the LLM response cache enabled")
+    parser.add_argument("--with-coalescing", action="store_true",
+                        help="Let identical concurrent requests share one execution")
+    parser.add_argument("--json", type=Path, help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    llm = FakeLLM(latency=args.latency, token_rate=args.token_rate, failure_rate=args.failure_rate)
+    results = run_benchmarks(args.routes.split(","), args.memory_sizes, args.concurrency,
+                             args.requests, llm, use_cache=args.with_cache,
+                             use_coalescing=args.with_coalescing)
+    print_results(results)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,146 @@
+import math
+import threading
+import weakref
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Set, Tuple
+from logger_config import setup_logging
+from memory_index import tokenize
+
+logger = setup_logging()
+
+# Upper bound on the "Previous context" tokens each route adds to its prompts.
+# Math is mostly answered by the exact engine, so it needs little history.
+ROUTE_TOKEN_BUDGETS = {
+    "math": 64,
+    "write": 256,
+    "translate": 96,
+    "multi": 192,
+    "default": 256,
+}
+DEFAULT_TOKEN_BUDGET = 192
+
+# Share of the budget the rolling summary may take; the rest goes to retrieved turns
+SUMMARY_SHARE = 0.25
+
+# Candidates retrieved before deduplication and budgeting
+SEARCH_K = 8
+# Token-set overlap above which two past turns count as the same exchange
+DUPLICATE_THRESHOLD = 0.6
+RESPONSE_PREVIEW = 100
+
+# The newest turns are left to retrieval; everything older is summarised
+RECENT_TURNS = 20
+# Rebuild a summary once this many turns have been added since the last one
+SUMMARY_REFRESH_EVERY = 10
+SUMMARY_TOPICS = 8
+
+# Summaries are rebuilt here so no request ever waits for one
+_summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summary")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, about four characters per token for English text"""
+    return math.ceil(len(text) / 4) if text else 0
+
+
+def summarize_turns(turns: List[Tuple[str, str]]) -> str:
+    """Compress (query, route) turns into a one-line summary of routes and topics"""
+    if not turns:
+        return ""
+    routes = Counter(route for _, route in turns)
+    topics: Counter = Counter()
+    for query, _ in turns:
+        topics.update({term for term in tokenize(query) if not term.isdigit()})
+    route_text = ", ".join(f"{route} ({count})" for route, count in routes.most_common())
+    topic_text = ", ".join(topic for topic, _ in topics.most_common(SUMMARY_TOPICS))
+    return f"Earlier conversation ({len(turns)} turns): {route_text}; frequent topics: {topic_text}"
+
+
+class RollingSummary:
+    """Summary of a memory's older turns, refreshed in the background"""
+
+    def __init__(self):
+        self.text = ""
+        self.version = 0  # Memory version the current text was built from
+        self._pending = False
+        self._lock = threading.Lock()
+
+    def get(self, memory) -> str:
+        """Return the current summary, scheduling a rebuild if it has gone stale"""
+        if len(memory.conversations) <= RECENT_TURNS:
+            return ""
+        if abs(memory.version - self.version) >= SUMMARY_REFRESH_EVERY or not self.text:
+            with self._lock:
+                if not self._pending:
+                    self._pending = True
+                    _summary_executor.submit(self._refresh, memory)
+        return self.text
+
+    def _refresh(self, memory):
+        try:
+            version = memory.version
+            self.text = summarize_turns(memory.get_older_turns(RECENT_TURNS))
+            self.version = version
+        except Exception as e:
+            logger.error(f"Error refreshing memory summary: {e}")
+        finally:
+            with self._lock:
+                self._pending = False
+
+
+# One summary per memory shard, dropped together with the shard
+_summaries: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_summaries_lock = threading.Lock()
+
+
+def rolling_summary(memory) -> RollingSummary:
+    """Return the rolling summary attached to a memory shard"""
+    with _summaries_lock:
+        summary = _summaries.get(memory)
+        if summary is None:
+            summary = _summaries[memory] = RollingSummary()
+        return summary
+
+
+def _similarity(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 1.0 if a == b else 0.0
+    return len(a & b) / len(a | b)
+
+
+def build_context(memory, query: str, route: str, budget: Optional[int] = None) -> str:
+    """Relevant history for a prompt, kept within the route's token budget
+
+    Near-duplicate past questions are included once, and older history is
+    represented by the rolling summary rather than individual turns.
+    """
+    budget = ROUTE_TOKEN_BUDGETS.get(route, DEFAULT_TOKEN_BUDGET) if budget is None else budget
+    if budget <= 0:
+        return ""
+
+    parts = []
+    used = 0
+    summary = rolling_summary(memory).get(memory)
+    if summary and estimate_tokens(summary) <= budget * SUMMARY_SHARE:
+        parts.append(summary)
+        used += estimate_tokens(summary)
+
+    seen: List[Set[str]] = []
+    for record in memory.search(query, SEARCH_K):
+        preview = record.response[:RESPONSE_PREVIEW]
+        terms = set(tokenize(f"{record.query} {preview}"))
+        if any(_similarity(terms, other) >= DUPLICATE_THRESHOLD for other in seen):
+            continue
+        line = f"Previous: {record.query} -> {preview}..."
+        remaining = budget - used
+        if estimate_tokens(line) > remaining:
+            # Keep a truncated entry if a useful amount of room is left
+            if remaining * 4 >= 40:
+                parts.append(line[:remaining * 4 - 3] + "...")
+            break
+        parts.append(line)
+        used += estimate_tokens(line)
+        seen.append(terms)
+
+    return "\n".join(parts)
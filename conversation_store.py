@@ -0,0 +1,152 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+
+class ConversationRecord:
+    """Compact storage for a single conversation turn"""
+    __slots__ = ("seq", "timestamp", "query", "response", "route", "metadata")
+
+    def __init__(self, seq: int, timestamp: str, query: str, response: str,
+                 route: str, metadata: Optional[Dict[str, Any]] = None):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.query = query
+        self.response = response
+        self.route = route
+        self.metadata = metadata or None  # Most turns have none; don't keep empty dicts
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the record in the dict shape used by memory.json"""
+        return {
+            "timestamp": self.timestamp,
+            "query": self.query,
+            "response": self.response,
+            "route": self.route,
+            "metadata": self.metadata or {}
+        }
+
+
+class ConversationStore:
+    """Fixed-capacity ring buffer of conversations, oldest evicted first"""
+
+    def __init__(self, capacity: int = 10000):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._slots: List[Optional[ConversationRecord]] = [None] * capacity
+        self._next_seq = 0
+        self._size = 0
+        # Bumped on every change so readers can tell whether cached views are stale
+        self.version = 0
+        # Running aggregates so statistics never rescan the buffer
+        self.route_counts: Dict[str, int] = {}
+        self.total_response_length = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for record in self.records():
+            yield record.to_dict()
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self._record_at(i).to_dict() for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("conversation index out of range")
+        return self._record_at(index).to_dict()
+
+    def _record_at(self, index: int) -> ConversationRecord:
+        """Record at a logical position, 0 being the oldest retained"""
+        first_seq = self._next_seq - self._size
+        return self._slots[(first_seq + index) % self.capacity]
+
+    def records(self) -> Iterator[ConversationRecord]:
+        """Iterate retained records, oldest first"""
+        for i in range(self._size):
+            yield self._record_at(i)
+
+    def append(self, conversation: Dict[str, Any]) -> Tuple[ConversationRecord, Optional[ConversationRecord]]:
+        """Store a conversation, returning the new record and any evicted one"""
+        seq = self._next_seq
+        record = ConversationRecord(
+            seq,
+            conversation.get("timestamp"),
+            conversation.get("query", ""),
+            conversation.get("response", ""),
+            conversation.get("route", ""),
+            conversation.get("metadata")
+        )
+
+        slot = seq % self.capacity
+        evicted = self._slots[slot] if self._size == self.capacity else None
+        if evicted is not None:
+            self._untrack(evicted)
+        else:
+            self._size += 1
+
+        self._slots[slot] = record
+        self._next_seq += 1
+        self.version += 1
+        self.route_counts[record.route] = self.route_counts.get(record.route, 0) + 1
+        self.total_response_length += len(record.response)
+        return record, evicted
+
+    def _untrack(self, record: ConversationRecord):
+        count = self.route_counts.get(record.route, 0) - 1
+        if count > 0:
+            self.route_counts[record.route] = count
+        else:
+            self.route_counts.pop(record.route, None)
+        self.total_response_length -= len(record.response)
+
+    def get_by_seq(self, seq: int) -> Optional[ConversationRecord]:
+        """Look up a record by sequence number, if it is still retained"""
+        if not self._next_seq - self._size <= seq < self._next_seq:
+            return None
+        return self._slots[seq % self.capacity]
+
+    def page(self, cursor: Optional[int] = None, limit: int = 20, route: Optional[str] = None,
+             since: Optional[str] = None, until: Optional[str] = None
+             ) -> Tuple[List[ConversationRecord], Optional[int]]:
+        """Matching records newest first, starting below the cursor sequence number
+
+        since and until are ISO timestamps (inclusive). Returns the page and the
+        cursor for the next one, or None when there are no older matches.
+        """
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        first_seq = self._next_seq - self._size
+        seq = self._next_seq - 1 if cursor is None else min(cursor - 1, self._next_seq - 1)
+        page: List[ConversationRecord] = []
+        while seq >= first_seq:
+            record = self._slots[seq % self.capacity]
+            seq -= 1
+            if route is not None and record.route != route:
+                continue
+            timestamp = record.timestamp or ""
+            if until is not None and timestamp > until:
+                continue
+            if since is not None and timestamp < since:
+                # Records are appended in time order, so nothing older can match
+                break
+            if len(page) == limit:
+                return page, page[-1].seq
+            page.append(record)
+        return page, None
+
+    def last(self) -> Optional[ConversationRecord]:
+        """Most recently added record"""
+        return self._record_at(self._size - 1) if self._size else None
+
+    def clear(self):
+        """Remove every record"""
+        self._slots = [None] * self.capacity
+        self._size = 0
+        self.version += 1
+        self.route_counts = {}
+        self.total_response_length = 0
@@ -0,0 +1,85 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+from logger_config import setup_logging
+
+logger = setup_logging()
+
+# End-to-end latency budget of one request
+REQUEST_BUDGET_SECONDS = float(os.getenv("REQUEST_BUDGET_SECONDS", "120"))
+
+# Kept back from every node so final_node can always assemble the partial results
+FINAL_RESERVE_SECONDS = 0.5
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when an LLM call outlives its node's share of the request budget"""
+
+
+class Budget:
+    """Deadline of the node currently running, and whether anything overran it"""
+    __slots__ = ("deadline", "exceeded")
+
+    def __init__(self, deadline: Optional[float]):
+        self.deadline = deadline
+        self.exceeded = False
+
+
+current_budget: contextvars.ContextVar = contextvars.ContextVar("current_budget", default=None)
+
+
+def request_deadline(budget_seconds: Optional[float] = None) -> float:
+    """Monotonic deadline for a request starting now"""
+    return time.monotonic() + (REQUEST_BUDGET_SECONDS if budget_seconds is None else budget_seconds)
+
+
+def node_deadline(deadline: Optional[float], stages_left: int = 1,
+                  reserve: float = FINAL_RESERVE_SECONDS) -> Optional[float]:
+    """Deadline for a stage starting now
+
+    What is left of the budget after the reserve is split evenly between this
+    stage and the stages_left - 1 still to run after it, so the last or only
+    stage gets all of it. Branches running in parallel share their stage's deadline.
+    """
+    if deadline is None:
+        return None
+    now = time.monotonic()
+    available = max(deadline - now - reserve, 0.0)
+    return now + available / max(stages_left, 1)
+
+
+@contextmanager
+def budget_scope(deadline: Optional[float]) -> Iterator[Budget]:
+    """Make deadline apply to every LLM call made inside the block"""
+    budget = Budget(deadline)
+    token = current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        current_budget.reset(token)
+
+
+def current_deadline() -> Optional[float]:
+    """Deadline of the innermost budget scope, if any"""
+    budget = current_budget.get()
+    return budget.deadline if budget is not None else None
+
+
+def deadline_node(name: str, fn):
+    """Wrap a graph node so its LLM calls share what is left of the request budget
+
+    Every processing node, including parallel branches, is the last stage
+    before final_node. Nodes whose calls overran are listed in state['timeouts'].
+    """
+    def wrapper(state: Dict[str, Any]) -> Dict[str, Any]:
+        with budget_scope(node_deadline(state.get('deadline'))) as budget:
+            result = fn(state)
+        if budget.exceeded:
+            logger.warning(f"{name} exceeded its time budget")
+            result['timeouts'] = result.get('timeouts', []) + [name]
+        return result
+
+    wrapper.__name__ = getattr(fn, "__name__", name)
+    return wrapper
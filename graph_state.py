@@ -0,0 +1,60 @@
+import operator
+from typing import Annotated, Any, Callable, Dict, List, Optional, TypedDict, get_type_hints
+
+
+def merge_dicts(left: Optional[Dict[str, Any]], right: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine two mappings, the right one winning on shared keys"""
+    return {**(left or {}), **(right or {})}
+
+
+class GraphState(TypedDict, total=False):
+    """State shared by the graph's nodes
+
+    Nodes return only the keys they produce. Annotated fields say how updates
+    from branches running in the same step are combined; every other field
+    keeps the value last written to it.
+    """
+    # Set once per request by make_initial_state
+    input: str
+    session_id: str
+    request_id: str
+    deadline: float
+
+    # Written by router_node
+    route: str
+    sub_routes: List[str]
+    memory_context: str
+
+    # Written by the processing nodes
+    math_result: str
+    math_exact: bool
+    story: str
+    translations: Annotated[Dict[str, str], merge_dicts]
+    target_languages: List[str]
+    translation: str
+    target_language: str
+    default_result: str
+
+    # Written by final_node
+    final_output: str
+
+    # Accumulated across nodes
+    timeouts: Annotated[List[str], operator.add]
+    trace: Annotated[List[Dict[str, Any]], operator.add]
+
+
+def _reducers() -> Dict[str, Callable[[Any, Any], Any]]:
+    hints = get_type_hints(GraphState, include_extras=True)
+    return {key: hint.__metadata__[0] for key, hint in hints.items() if hasattr(hint, "__metadata__")}
+
+
+# Field name -> function combining the current value with an update
+REDUCERS = _reducers()
+
+
+def apply_update(state: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge a node's partial update into state in place, as the graph would"""
+    for key, value in update.items():
+        reducer = REDUCERS.get(key)
+        state[key] = reducer(state[key], value) if reducer and key in state else value
+    return state
@@ -1,105 +1,182 @@
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from matplotlib.patches import FancyBboxPatch
+import hashlib
+import io
+import json
 import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 from logger_config import setup_logging
 
 logger = setup_logging()
 
-def visualize_graph(save_path: str = "graph_structure.png"):
-    """Create a visual representation of the graph structure"""
+# Bump when the drawing code changes so cached images are re-rendered
+RENDER_VERSION = 2
+
+# Node colors; nodes not listed here are drawn in light gray
+NODE_COLORS = {
+    'START': 'lightgreen',
+    'router': 'lightblue',
+    'multi_node': 'plum',
+    'math_node': 'lightcoral',
+    'writer_node': 'lightyellow',
+    'translator_node': 'lightpink',
+    'default_node': 'lightgray',
+    'final_node': 'lightcyan',
+    'END': 'lightgreen'
+}
+
+_LANGGRAPH_NAMES = {'__start__': 'START', '__end__': 'END'}
+
+Edge = Tuple[str, str, bool]
+
+# Rendered PNG bytes keyed by topology hash, shared by every caller in the process
+_image_cache: Dict[str, bytes] = {}
+# Compiled graphs never change, so their topology is read once per object
+_topology_cache: Dict[int, Tuple[object, List[str], List[Edge]]] = {}
+_cache_lock = threading.Lock()
+
+
+def graph_topology(graph=None) -> Tuple[List[str], List[Edge]]:
+    """Read nodes and (source, target, conditional) edges from the compiled graph"""
+    if graph is None:
+        from main import get_app
+        graph = get_app()
+
+    cached = _topology_cache.get(id(graph))
+    if cached is not None and cached[0] is graph:
+        return cached[1], cached[2]
+
+    drawable = graph.get_graph()
+    nodes = sorted(_LANGGRAPH_NAMES.get(n, n) for n in drawable.nodes)
+    edges = sorted({
+        (_LANGGRAPH_NAMES.get(e.source, e.source), _LANGGRAPH_NAMES.get(e.target, e.target), bool(e.conditional))
+        for e in drawable.edges
+    })
+    _topology_cache[id(graph)] = (graph, nodes, edges)
+    return nodes, edges
+
+
+def topology_hash(nodes: List[str], edges: List[Edge]) -> str:
+    """Stable hash of a graph topology and the renderer version"""
+    payload = json.dumps([RENDER_VERSION, nodes, edges])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _layout(nodes: List[str], edges: List[Edge]) -> Dict[str, Tuple[float, float]]:
+    """Place nodes in columns by their longest distance from START"""
+    depth = {node: 0 for node in nodes}
+    # Longest path relaxation; the graph is a DAG so len(nodes) passes suffice
+    for _ in range(len(nodes)):
+        changed = False
+        for source, target, _ in edges:
+            if source != target and depth[target] < depth[source] + 1 and depth[source] + 1 < len(nodes):
+                depth[target] = depth[source] + 1
+                changed = True
+        if not changed:
+            break
+
+    columns: Dict[int, List[str]] = {}
+    for node in nodes:
+        columns.setdefault(depth[node], []).append(node)
+
+    positions = {}
+    for column, members in columns.items():
+        for i, node in enumerate(members):
+            positions[node] = (column * 2.5, (len(members) - 1) - i * 2.0)
+    return positions
+
+
+def _render(nodes: List[str], edges: List[Edge]) -> bytes:
+    """Draw the topology and return it as PNG bytes"""
+    # matplotlib is slow to import, so only load it when a figure is drawn
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib.patches import FancyBboxPatch
+
+    positions = _layout(nodes, edges)
+    fig, ax = plt.subplots(1, 1, figsize=(14, 10))
+
+    # Draw nodes
+    for node, (x, y) in positions.items():
+        bbox = FancyBboxPatch(
+            (x - 0.8, y - 0.3), 1.6, 0.6,
+            boxstyle="round,pad=0.1",
+            facecolor=NODE_COLORS.get(node, 'lightgray'),
+            edgecolor='black',
+            linewidth=2
+        )
+        ax.add_patch(bbox)
+        ax.text(x, y, node, ha='center', va='center', fontsize=10, fontweight='bold')
+
+    # Draw edges: direct in blue, conditional dashed in red
+    for start, end, conditional in edges:
+        style = dict(arrowstyle='->', lw=2, color='red', linestyle='dashed') if conditional \
+            else dict(arrowstyle='->', lw=2, color='blue')
+        ax.annotate('', xy=positions[end], xytext=positions[start], arrowprops=style)
+
+    xs = [x for x, _ in positions.values()]
+    ys = [y for _, y in positions.values()]
+    ax.set_xlim(min(xs) - 1, max(xs) + 1)
+    ax.set_ylim(min(ys) - 1, max(ys) + 1)
+    ax.set_aspect('equal')
+    ax.axis('off')
+    ax.set_title('LangGraph Router System Architecture', fontsize=16, fontweight='bold')
+
+    # Add legend
+    legend_elements = [
+        plt.Line2D([0], [0], color='blue', lw=2, label='Direct Flow'),
+        plt.Line2D([0], [0], color='red', lw=2, linestyle='dashed', label='Conditional Flow')
+    ]
+    ax.legend(handles=legend_elements, loc='upper right')
+
+    plt.tight_layout()
+    buffer = io.BytesIO()
+    plt.savefig(buffer, format='png', dpi=300, bbox_inches='tight')
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def graph_image(graph=None) -> Optional[bytes]:
+    """PNG of the compiled graph, rendered only when its topology changes"""
     try:
-        fig, ax = plt.subplots(1, 1, figsize=(14, 10))
-
-        # Define node positions
-        positions = {
-            'START': (0, 0),
-            'router': (2, 0),
-            'math_node': (4, 2),
-            'writer_node': (4, 0),
-            'translator_node': (4, -2),
-            'default_node': (4, -4),
-            'final_node': (6, 0),
-            'END': (8, 0)
-        }
-
-        # Define node colors
-        colors = {
-            'START': 'lightgreen',
-            'router': 'lightblue',
-            'math_node': 'lightcoral',
-            'writer_node': 'lightyellow',
-            'translator_node': 'lightpink',
-            'default_node': 'lightgray',
-            'final_node': 'lightcyan',
-            'END': 'lightgreen'
-        }
-
-        # Draw nodes
-        for node, (x, y) in positions.items():
-            bbox = FancyBboxPatch(
-                (x - 0.8, y - 0.3), 1.6, 0.6,
-                boxstyle="round,pad=0.1",
-                facecolor=colors[node],
-                edgecolor='black',
-                linewidth=2
-            )
-            ax.add_patch(bbox)
-            ax.text(x, y, node, ha='center', va='center', fontsize=10, fontweight='bold')
-
-        # Draw edges
-        edges = [
-            ('START', 'router'),
-            ('router', 'math_node'),
-            ('router', 'writer_node'),
-            ('router', 'translator_node'),
-            ('router', 'default_node'),
-            ('math_node', 'final_node'),
-            ('writer_node', 'final_node'),
-            ('translator_node', 'final_node'),
-            ('default_node', 'final_node'),
-            ('final_node', 'END')
-        ]
-
-        for start, end in edges:
-            start_pos = positions[start]
-            end_pos = positions[end]
-            ax.annotate('', xy=end_pos, xytext=start_pos,
-                        arrowprops=dict(arrowstyle='->', lw=2, color='blue'))
-
-        # Add conditional edges (dashed)
-        conditional_edges = [
-            ('math_node', 'writer_node'),
-            ('math_node', 'translator_node'),
-            ('writer_node', 'translator_node')
-        ]
-
-        for start, end in conditional_edges:
-            start_pos = positions[start]
-            end_pos = positions[end]
-            ax.annotate('', xy=end_pos, xytext=start_pos,
-                        arrowprops=dict(arrowstyle='->', lw=2, color='red', linestyle='dashed'))
-
-        ax.set_xlim(-1, 9)
-        ax.set_ylim(-5, 3)
-        ax.set_aspect('equal')
-        ax.axis('off')
-        ax.set_title('LangGraph Router System Architecture', fontsize=16, fontweight='bold')
-
-        # Add legend
-        legend_elements = [
-            plt.Line2D([0], [0], color='blue', lw=2, label='Direct Flow'),
-            plt.Line2D([0], [0], color='red', lw=2, linestyle='dashed', label='Conditional Flow')
-        ]
-        ax.legend(handles=legend_elements, loc='upper right')
-
-        plt.tight_layout()
-        plt.savefig(save_path, dpi=300, bbox_inches='tight')
-        plt.close()
+        nodes, edges = graph_topology(graph)
+        key = topology_hash(nodes, edges)
+        with _cache_lock:
+            if key not in _image_cache:
+                _image_cache[key] = _render(nodes, edges)
+                logger.info(f"Rendered graph visualization {key[:12]}")
+            return _image_cache[key]
+    except Exception as e:
+        logger.error(f"Error creating graph visualization: {e}")
+        return None
+
+
+def visualize_graph(save_path: str = "graph_structure.png", graph=None) -> bool:
+    """Create a visual representation of the graph structure
+
+    The file is only rewritten when the topology hash stored next to it
+    differs from the current graph's.
+    """
+    try:
+        nodes, edges = graph_topology(graph)
+        key = topology_hash(nodes, edges)
+        path = Path(save_path)
+        hash_path = path.with_name(path.name + ".sha256")
+
+        if path.exists() and hash_path.exists() and hash_path.read_text().strip() == key:
+            logger.info(f"Graph visualization up to date at {save_path}")
+            return True
+
+        image = graph_image(graph)
+        if image is None:
+            return False
+        path.write_bytes(image)
+        hash_path.write_text(key)
 
         logger.info(f"Graph visualization saved to {save_path}")
         return True
 
     except Exception as e:
         logger.error(f"Error creating graph visualization: {e}")
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,157 @@
+import math
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Iterator, List, Optional
+from deadlines import DeadlineExceeded
+from logger_config import setup_logging
+from metrics import registry
+
+logger = setup_logging()
+
+# Concurrent LLM calls assumed when the backend does not report its capacity
+DEFAULT_CAPACITY = 16
+
+# Attempt workers by size; attempts blocked on a hung host only hold a worker
+# until their read timeout
+_executors: Dict[int, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def _attempt_executor(workers: int) -> ThreadPoolExecutor:
+    with _executors_lock:
+        executor = _executors.get(workers)
+        if executor is None:
+            executor = _executors[workers] = ThreadPoolExecutor(max_workers=workers,
+                                                                thread_name_prefix="llm-attempt")
+        return executor
+
+
+class LatencyTracker:
+    """Rolling latency samples per key, used to pick hedge delays"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, key: str, pct: float = 95) -> Optional[float]:
+        """Nearest-rank percentile, or None until enough samples have been seen"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[max(1, math.ceil(pct / 100 * len(samples))) - 1]
+
+
+def _inline_stream(start: Callable[[], Iterator[str]], deadline: Optional[float]) -> Iterator[str]:
+    """Run a single attempt on the caller's thread, checking the deadline between tokens
+
+    A wait for the next token is only cut short if the backend bounds its
+    reads by the deadline itself, as PooledOllamaLLM does.
+    """
+    stream = start()
+    try:
+        for token in stream:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise DeadlineExceeded("LLM call exceeded its time budget")
+            yield token
+    finally:
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+
+
+def hedged_stream(start: Callable[[], Iterator[str]], deadline: Optional[float] = None,
+                  hedge_after: Optional[float] = None, max_attempts: int = 2,
+                  capacity: int = DEFAULT_CAPACITY) -> Iterator[str]:
+    """Yield the tokens of whichever attempt produces one first, cancelling the others
+
+    A duplicate attempt is started when no token has arrived hedge_after
+    seconds in, and DeadlineExceeded is raised as soon as the deadline
+    passes, even if an attempt is stuck waiting on the network. Attempts run
+    on workers sized for capacity concurrent calls. Without hedge_after the
+    single attempt runs inline, so callers are never limited by the workers.
+    """
+    if hedge_after is None:
+        yield from _inline_stream(start, deadline)
+        return
+
+    executor = _attempt_executor(capacity * max_attempts)
+    events: "queue.Queue" = queue.Queue()
+    cancels: List[threading.Event] = []
+
+    def run(attempt: int, cancel: threading.Event):
+        try:
+            stream = start()
+            try:
+                for token in stream:
+                    if cancel.is_set():
+                        break
+                    events.put((attempt, "token", token))
+            finally:
+                # Closing the generator drops the HTTP response, which aborts generation
+                close = getattr(stream, "close", None)
+                if close:
+                    close()
+            events.put((attempt, "done", None))
+        except Exception as e:
+            events.put((attempt, "error", e))
+
+    def launch():
+        cancel = threading.Event()
+        cancels.append(cancel)
+        executor.submit(run, len(cancels) - 1, cancel)
+
+    launch()
+    started = time.monotonic()
+    winner: Optional[int] = None
+    failed = 0
+    try:
+        while True:
+            now = time.monotonic()
+            # Checked before every event, since a fast producer keeps the queue
+            # from ever running empty
+            if deadline is not None and now >= deadline:
+                raise DeadlineExceeded("LLM call exceeded its time budget")
+            can_hedge = winner is None and hedge_after is not None and len(cancels) < max_attempts
+            waits = []
+            if deadline is not None:
+                waits.append(deadline - now)
+            if can_hedge:
+                waits.append(started + hedge_after - now)
+            try:
+                attempt, kind, value = events.get(timeout=max(min(waits), 0.0) if waits else None)
+            except queue.Empty:
+                if can_hedge and time.monotonic() >= started + hedge_after:
+                    logger.info(f"No token after {hedge_after:.2f}s, sending a hedged request")
+                    registry.increment("langgraph_llm_hedged_requests_total", 1,
+                                       "Duplicate LLM requests sent to cut tail latency")
+                    launch()
+                continue
+
+            if winner is not None and attempt != winner:
+                continue
+            if kind == "token":
+                if winner is None:
+                    winner = attempt
+                    for i, cancel in enumerate(cancels):
+                        if i != winner:
+                            cancel.set()
+                yield value
+            elif kind == "done":
+                return
+            else:
+                failed += 1
+                if winner == attempt or failed == len(cancels):
+                    raise value
+    finally:
+        for cancel in cancels:
+            cancel.set()
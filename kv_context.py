@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+from logger_config import setup_logging
+
+logger = setup_logging()
+
+# Ollama unloads an idle model after its keep-alive (5 minutes by default),
+# after which a stored context no longer saves any prefill
+CONTEXT_TTL_SECONDS = 300.0
+
+# Start over with a plain prompt before the carried context nears num_ctx
+MAX_CONTEXT_TOKENS = 3072
+
+# (session, node) pairs remembered at once, least recently used dropped first
+MAX_CONTEXTS = 1000
+
+
+class KVContext(NamedTuple):
+    """Conversation context returned by Ollama for one session and node"""
+    tokens: List[int]
+    host: Optional[str]
+    expires: float
+
+
+class KVContextStore:
+    """Ollama conversation contexts per (session, node), expiring with the model keep-alive"""
+
+    def __init__(self, ttl_seconds: float = CONTEXT_TTL_SECONDS,
+                 max_tokens: int = MAX_CONTEXT_TOKENS, max_contexts: int = MAX_CONTEXTS):
+        self.ttl_seconds = ttl_seconds
+        self.max_tokens = max_tokens
+        self.max_contexts = max_contexts
+        self._contexts: "OrderedDict[Tuple[str, str], KVContext]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str, node: str) -> Optional[KVContext]:
+        """Return the live context for a session's node, or None if there is none or it expired"""
+        key = (session_id, node)
+        with self._lock:
+            context = self._contexts.get(key)
+            if context is None:
+                return None
+            if context.expires < time.monotonic():
+                del self._contexts[key]
+                logger.info(f"KV context for {node} in session {session_id} expired")
+                return None
+            self._contexts.move_to_end(key)
+            return context
+
+    def put(self, session_id: str, node: str, tokens: List[int], host: Optional[str] = None):
+        """Store the context returned by a generation, dropping it once it grows too long"""
+        key = (session_id, node)
+        with self._lock:
+            if not tokens or len(tokens) > self.max_tokens:
+                self._contexts.pop(key, None)
+                return
+            self._contexts[key] = KVContext(tokens, host, time.monotonic() + self.ttl_seconds)
+            self._contexts.move_to_end(key)
+            while len(self._contexts) > self.max_contexts:
+                self._contexts.popitem(last=False)
+
+    def discard(self, session_id: str, node: str):
+        """Forget a context, e.g. after Ollama rejected it"""
+        with self._lock:
+            self._contexts.pop((session_id, node), None)
+
+    def clear(self):
+        """Forget every context"""
+        with self._lock:
+            self._contexts.clear()
+
+
+kv_contexts = KVContextStore()
@@ -0,0 +1,101 @@
+import hashlib
+import os
+import random
+import threading
+import time
+from typing import Any, Iterator, Optional
+from logger_config import setup_logging
+
+logger = setup_logging()
+
+# Vocabulary the fake backend draws its deterministic responses from
+_FAKE_WORDS = ("the", "quick", "model", "answer", "story", "number", "result", "bright",
+               "summer", "river", "calm", "value", "light", "morning", "garden", "clear")
+
+
+class FakeLLMError(RuntimeError):
+    """Injected failure raised by FakeLLM"""
+
+
+class FakeLLM:
+    """Deterministic in-process stand-in for OllamaLLM with configurable latency"""
+
+    def __init__(self, model: str = "fake-mistral", latency: float = 0.05, token_rate: float = 200.0,
+                 failure_rate: float = 0.0, response_tokens: int = 50, seed: int = 0):
+        self.model = model
+        self.latency = latency              # Seconds before the first token
+        self.token_rate = token_rate        # Tokens per second after that; 0 means instant
+        self.failure_rate = failure_rate    # Probability that a call raises FakeLLMError
+        self.response_tokens = response_tokens
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _should_fail(self) -> bool:
+        if not self.failure_rate:
+            return False
+        with self._lock:
+            return self._rng.random() < self.failure_rate
+
+    def _tokens(self, prompt: str) -> Iterator[str]:
+        # Same prompt, same answer, so cache and coalescing paths are exercised
+        digest = hashlib.sha256(prompt.encode('utf-8')).digest()
+        for i in range(self.response_tokens):
+            word = _FAKE_WORDS[digest[i % len(digest)] % len(_FAKE_WORDS)]
+            yield word if i == 0 else f" {word}"
+
+    def stream(self, prompt: str, **kwargs: Any) -> Iterator[str]:
+        """Yield the response token by token at the configured rate"""
+        if self._should_fail():
+            raise FakeLLMError("Injected fake LLM failure")
+        time.sleep(self.latency)
+        delay = 1.0 / self.token_rate if self.token_rate else 0.0
+        for token in self._tokens(prompt):
+            if delay:
+                time.sleep(delay)
+            yield token
+
+    def invoke(self, prompt: str, **kwargs: Any) -> str:
+        """Return the whole response once it has been generated"""
+        return "".join(self.stream(prompt))
+
+
+def create_llm(backend: Optional[str] = None) -> Any:
+    """Create the LLM client selected by name or the LLM_BACKEND env variable"""
+    backend = backend or os.getenv("LLM_BACKEND", "ollama")
+    if backend == "fake":
+        return FakeLLM(
+            latency=float(os.getenv("FAKE_LLM_LATENCY", "0.05")),
+            token_rate=float(os.getenv("FAKE_LLM_TOKEN_RATE", "200")),
+            failure_rate=float(os.getenv("FAKE_LLM_FAILURE_RATE", "0"))
+        )
+    if backend == "ollama":
+        from ollama_pool import OllamaPool, PooledOllamaLLM, hosts_from_env
+        pool = OllamaPool(hosts_from_env(), per_host_limit=int(os.getenv("OLLAMA_PER_HOST_LIMIT", "4")))
+        return PooledOllamaLLM(model=os.getenv("OLLAMA_MODEL", "mistral"), pool=pool)
+    if backend == "langchain":
+        # Single-host client from langchain_ollama, as used before the pool existed
+        from langchain_ollama import OllamaLLM
+        return OllamaLLM(model=os.getenv("OLLAMA_MODEL", "mistral"))
+    raise ValueError(f"Unknown LLM backend: {backend!r}")
+
+
+_llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm() -> Any:
+    """Return the shared LLM client, creating it on first use"""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = create_llm()
+                logger.info(f"LLM backend initialised: {type(_llm).__name__} ({_llm.model})")
+    return _llm
+
+
+def set_llm(llm: Any):
+    """Replace the shared LLM client, e.g. with a FakeLLM for benchmarks"""
+    global _llm
+    with _llm_lock:
+        _llm = llm
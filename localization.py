@@ -0,0 +1,94 @@
+import re
+from typing import Dict, NamedTuple, Optional
+
+
+class NumberFormat(NamedTuple):
+    """How a language writes numbers"""
+    decimal: str
+    group: str
+    digits: Optional[str] = None  # Native digits 0-9, if not the Western ones
+    indian_grouping: bool = False  # 12,34,567 instead of 1,234,567
+
+
+# Keyed by the display names in router.LANGUAGES
+NUMBER_FORMATS: Dict[str, NumberFormat] = {
+    'Spanish': NumberFormat(",", "."),
+    'French': NumberFormat(",", "\u202f"),  # Narrow no-break space
+    'German': NumberFormat(",", "."),
+    'Italian': NumberFormat(",", "."),
+    'Portuguese': NumberFormat(",", "."),
+    'Chinese': NumberFormat(".", ","),
+    'Japanese': NumberFormat(".", ","),
+    'Korean': NumberFormat(".", ","),
+    'Hindi': NumberFormat(".", ",", indian_grouping=True),
+    'Arabic': NumberFormat("٫", "٬", digits="٠١٢٣٤٥٦٧٨٩"),
+}
+
+# "The result of <expression> is <value>."
+RESULT_PHRASES: Dict[str, str] = {
+    'Spanish': "El resultado de {expression} es {value}.",
+    'French': "Le résultat de {expression} est {value}.",
+    'German': "Das Ergebnis von {expression} ist {value}.",
+    'Italian': "Il risultato di {expression} è {value}.",
+    'Portuguese': "O resultado de {expression} é {value}.",
+    'Chinese': "{expression} 的结果是 {value}。",
+    'Japanese': "{expression} の結果は {value} です。",
+    'Korean': "{expression}의 결과는 {value}입니다.",
+    'Hindi': "{expression} का परिणाम {value} है।",
+    'Arabic': "ناتج {expression} هو {value}.",
+}
+
+_OPERATORS = {"**": "^", "*": "×", "/": "÷"}
+_OPERATOR = re.compile(r'\*\*|[*/]')
+_NUMBER = re.compile(r'(?<![\w.])(-?)(\d+)(?:\.(\d+))?(?![\w.])')
+_PLAIN_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def _group(digits: str, separator: str, indian: bool) -> str:
+    if len(digits) <= 3:
+        return digits
+    head, tail = digits[:-3], digits[-3:]
+    size = 2 if indian else 3
+    groups = []
+    while head:
+        groups.insert(0, head[-size:])
+        head = head[:-size]
+    return separator.join(groups + [tail])
+
+
+def format_number(number: str, language: str) -> str:
+    """Rewrite a plain decimal such as "-1234.5" in a language's number format"""
+    fmt = NUMBER_FORMATS[language]
+    match = _NUMBER.fullmatch(number)
+    if not match:
+        return number
+    sign, integer, fraction = match.groups()
+    text = sign + _group(integer, fmt.group, fmt.indian_grouping)
+    if fraction:
+        text += fmt.decimal + fraction
+    if fmt.digits:
+        text = text.translate(str.maketrans("0123456789", fmt.digits))
+    return text
+
+
+def localize_expression(expression: str, language: str) -> str:
+    """Localise the numbers in an expression and use typographic operators"""
+    text = _NUMBER.sub(lambda m: format_number(m.group(), language), expression)
+    return _OPERATOR.sub(lambda m: _OPERATORS[m.group()], text)
+
+
+def localize_math_result(math_result: str, language: str) -> Optional[str]:
+    """Render an exact "expression = value" result in a language without an LLM
+
+    Returns None for unsupported languages or anything that is not a plain
+    engine result, so the caller can fall back to translating it.
+    """
+    if language not in RESULT_PHRASES:
+        return None
+    expression, separator, value = math_result.rpartition(" = ")
+    if not separator or not expression or not _PLAIN_NUMBER.fullmatch(value):
+        return None
+    return RESULT_PHRASES[language].format(
+        expression=localize_expression(expression, language),
+        value=format_number(value, language)
+    )
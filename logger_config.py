@@ -1,40 +1,169 @@
+import atexit
+import contextvars
+import json
 import logging
+import os
+import queue
+import threading
+import zlib
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from typing import Any, Dict, Optional
 
+ROOT_LOGGER = "langgraph_router"
 
-def setup_logging(log_file: str = "langgraph_router.log") -> logging.Logger:
-    """Configure and setup logging"""
+# Size-based rotation of the JSON log file
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
 
-    # Create logs directory if it doesn't exist
-    log_dir = Path("logs")
-    log_dir.mkdir(exist_ok=True)
+# Records waiting for the writer thread; beyond this they are dropped rather
+# than blocking the request that logged them
+LOG_QUEUE_SIZE = 10000
 
-    # Configure logging
-    logger = logging.getLogger("langgraph_router")
+# Fraction of records below WARNING kept per logger, e.g.
+# LOG_SAMPLE_RATES="langgraph_router.nodes=0.1,langgraph_router.cache=0.01"
+DEFAULT_SAMPLE_RATES = {f"{ROOT_LOGGER}.nodes": 1.0}
 
-    if not logger.handlers:  # Only add handlers if they don't exist
-        logger.setLevel(logging.INFO)
+# Id of the request being handled, attached to every record logged for it
+current_request_id: contextvars.ContextVar = contextvars.ContextVar("current_request_id", default=None)
 
-        # Create formatters
-        file_formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        console_formatter = logging.Formatter(
-            '%(levelname)s: %(message)s'
-        )
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
 
-        # File handler
-        file_handler = logging.FileHandler(log_dir / log_file)
-        file_handler.setLevel(logging.INFO)
-        file_handler.setFormatter(file_formatter)
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
 
-        # Console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
-        console_handler.setFormatter(console_formatter)
 
-        # Add handlers
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+def _parse_sample_rates(spec: str) -> Dict[str, float]:
+    rates = dict(DEFAULT_SAMPLE_RATES)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rate = item.partition("=")
+        name = name.strip()
+        if not name.startswith(ROOT_LOGGER):
+            name = f"{ROOT_LOGGER}.{name}"
+        rates[name] = float(rate)
+    return rates
 
-    return logger
\ No newline at end of file
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the current request id on the thread that logged them"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = current_request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of the records below WARNING from selected loggers
+
+    Records tied to a request are kept or dropped together, so a sampled
+    request is logged in full; the others are sampled by count.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.name, 1.0)
+        if rate >= 1.0 or record.levelno >= logging.WARNING:
+            return True
+        if rate <= 0.0:
+            return False
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            return zlib.crc32(f"{record.name}:{request_id}".encode()) % 10000 < rate * 10000
+        with self._lock:
+            count = self._counts[record.name] = self._counts.get(record.name, 0) + 1
+        # Keeps exactly one record whenever count * rate crosses a whole number
+        return int(count * rate) != int((count - 1) * rate)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any extra= fields such as duration_ms"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Hand records to the writer thread, dropping them if it has fallen behind"""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            type(self).dropped += 1
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        # Drains whatever is still queued before the process exits
+        _listener.stop()
+        _listener = None
+
+
+def setup_logging(log_file: str = "langgraph_router.log", name: Optional[str] = None) -> logging.Logger:
+    """Configure and setup logging
+
+    Records are queued and written by a background thread, as JSON lines to a
+    rotating file under logs/ and as plain text to the console. name returns
+    a child logger, which can be sampled on its own via LOG_SAMPLE_RATES.
+    """
+    global _listener
+
+    logger = logging.getLogger(ROOT_LOGGER)
+
+    with _setup_lock:
+        if not logger.handlers:  # Only add handlers if they don't exist
+            logger.setLevel(logging.INFO)
+
+            # Create logs directory if it doesn't exist
+            log_dir = Path("logs")
+            log_dir.mkdir(exist_ok=True)
+
+            # File handler; the file is only opened on the first record
+            file_handler = RotatingFileHandler(log_dir / log_file, maxBytes=LOG_MAX_BYTES,
+                                               backupCount=LOG_BACKUP_COUNT, encoding="utf-8", delay=True)
+            file_handler.setLevel(logging.INFO)
+            file_handler.setFormatter(JsonFormatter())
+
+            # Console handler
+            console_handler = logging.StreamHandler()
+            console_handler.setLevel(logging.INFO)
+            console_handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+
+            # Callers only pay for filtering and a queue put; both handlers
+            # run on the listener's thread
+            queue_handler = _NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+            queue_handler.addFilter(RequestContextFilter())
+            queue_handler.addFilter(SamplingFilter(_parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))))
+            logger.addHandler(queue_handler)
+
+            _listener = QueueListener(queue_handler.queue, file_handler, console_handler,
+                                      respect_handler_level=True)
+            _listener.start()
+            atexit.register(_stop_listener)
+
+    return logger.getChild(name) if name else logger
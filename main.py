@@ -1,175 +1,382 @@
-from langchain_ollama import OllamaLLM
-from langgraph.graph import StateGraph, START, END
-from typing import Dict, Any, Literal, Optional, List
-import re
+from typing import Dict, Any, Literal, Optional, List, Iterator, Tuple, Union
 import json
-import logging
-from datetime import datetime
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from memory_manager import Memory
+from session_memory import SessionMemory, DEFAULT_SESSION
 from graph_visualizer import visualize_graph
 from logger_config import setup_logging
+from router import router, DEFAULT_LANGUAGE
+import math_engine
+from localization import localize_math_result
+from planner import plan_stages, quoted_text, build_dependencies
+from pipeline import PipelinedTranslator
+from llm_cache import LLMCache, cache_key, llm_params, normalize_prompt
+from context_builder import build_context, estimate_tokens
+from kv_context import KVContext, kv_contexts
+from singleflight import FlightAbandoned, SingleFlight
+from deadlines import Budget, DeadlineExceeded, budget_scope, current_budget, current_deadline, deadline_node, node_deadline, request_deadline
+from hedging import DEFAULT_CAPACITY, LatencyTracker, hedged_stream
+from llm_backends import get_llm
+from metrics import span, traced_node, start_metrics_server
+from graph_state import GraphState, apply_update
 
 # Set up logging
 logger = setup_logging()
-
-# Initialize the LLM
-llm = OllamaLLM(model="mistral")
-
-# Global memory instance
-memory = Memory()
-
-def router_node(state: Dict[str, Any]) -> Dict[str, Any]:
+# Per-request node messages, sampled separately via LOG_SAMPLE_RATES
+node_logger = setup_logging(name="nodes")
+
+# Longest part of a query written to the logs
+LOG_QUERY_CHARS = 200
+
+# Process-wide singletons, created on first use so importing main stays cheap.
+# main.memory and main.llm_cache still work through the module __getattr__ below.
+_sessions: Optional[SessionMemory] = None
+_llm_cache: Optional[LLMCache] = None
+_app = None
+_init_lock = threading.Lock()
+
+def get_sessions() -> SessionMemory:
+    """Return the per-session memory shards, creating the registry on first use"""
+    global _sessions
+    if _sessions is None:
+        with _init_lock:
+            if _sessions is None:
+                _sessions = SessionMemory()
+    return _sessions
+
+def get_memory(session_id: str = DEFAULT_SESSION) -> Memory:
+    """Return the memory shard of a session, loading it on first use"""
+    return get_sessions().get(session_id)
+
+def set_memory(memory: Memory, session_id: str = DEFAULT_SESSION):
+    """Replace a session's memory, e.g. with a throwaway store in benchmarks"""
+    get_sessions().set(session_id, memory)
+
+def get_llm_cache() -> LLMCache:
+    """Return the persistent LLM response cache, opening it on first use"""
+    global _llm_cache
+    if _llm_cache is None:
+        with _init_lock:
+            if _llm_cache is None:
+                _llm_cache = LLMCache()
+    return _llm_cache
+
+def __getattr__(name: str):
+    # Backwards compatible access to the lazily created singletons
+    if name == "memory":
+        return get_memory()
+    if name == "llm_cache":
+        return get_llm_cache()
+    if name == "llm":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Routes listed here always get fresh output instead of cached responses
+LLM_CACHE_ENABLED = True
+CACHE_SKIP_ROUTES = {"write"}
+
+# Route served by each LLM-calling node
+NODE_ROUTES = {
+    "math_node": "math",
+    "writer_node": "write",
+    "translator_node": "translate",
+    "default_node": "default",
+}
+
+# Worker pools for fanning LLM-bound work out, by purpose and size. They are
+# sized to what the backend can serve at once, so concurrent requests only
+# queue for workers once the backend itself is full
+_fanout_executors: Dict[Tuple[str, int], ThreadPoolExecutor] = {}
+_fanout_lock = threading.Lock()
+
+def llm_capacity(llm=None) -> int:
+    """Concurrent LLM calls the backend can serve"""
+    return getattr(getattr(llm or get_llm(), "pool", None), "capacity", DEFAULT_CAPACITY)
+
+def fanout_executor(purpose: str) -> ThreadPoolExecutor:
+    """Return the worker pool for purpose, e.g. "branch", sized to the current backend"""
+    key = (purpose, llm_capacity())
+    with _fanout_lock:
+        executor = _fanout_executors.get(key)
+        if executor is None:
+            executor = _fanout_executors[key] = ThreadPoolExecutor(max_workers=key[1],
+                                                                   thread_name_prefix=purpose)
+        return executor
+
+# Translate "write ... and translate it" stories chunk by chunk while they stream
+PIPELINE_TRANSLATION = True
+TRANSLATION_CONCURRENCY = 3
+
+# Continue each session's per-node Ollama context so repeat turns skip re-prefilling history
+KV_CONTEXT_REUSE = True
+
+# With several target languages, "concurrent" makes one LLM call per language
+# in parallel and "structured" asks for all of them in a single JSON reply
+MULTI_LANGUAGE_MODE = "concurrent"
+
+# Identical requests and LLM prompts that arrive while one is already running
+# wait for it and share its result instead of running again
+COALESCE_REQUESTS = True
+graph_flights = SingleFlight("graph")
+llm_flights = SingleFlight("llm")
+
+# Send a duplicate LLM request when no token has arrived by the node's recent
+# p95 time to first token; whichever answers first is kept
+HEDGE_REQUESTS = False
+HEDGE_PERCENTILE = 95
+latency_tracker = LatencyTracker()
+
+# Appended to answers cut off by their node's time budget
+TRUNCATED_NOTE = "\n\n[Response cut short: time budget exceeded]"
+
+# Optional per-token hook, set while a node's output feeds a pipeline
+token_listener: contextvars.ContextVar = contextvars.ContextVar("token_listener", default=None)
+
+def _stream_writer():
+    """Return the graph's custom stream writer, or None outside a graph run"""
+    from langgraph.config import get_stream_writer
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        return None
+
+def kv_reuse_enabled(session_id: Optional[str], llm=None) -> bool:
+    """Whether LLM calls for session_id continue the session's previous Ollama contexts"""
+    # The default session is shared by batch runs and the CLI, whose queries are
+    # unrelated, so only real conversations continue a previous context
+    return (KV_CONTEXT_REUSE and session_id not in (None, DEFAULT_SESSION)
+            and getattr(llm or get_llm(), "supports_context", False))
+
+def generate(prompt: str, node: str, stream: bool = True, session_id: Optional[str] = None,
+             turn_prompt: Optional[str] = None, label: Optional[str] = None) -> str:
+    """Call the LLM, forwarding tokens to the graph's custom stream as they arrive
+
+    With a non-default session_id and an Ollama backend, the context Ollama
+    returned for the session's previous turn on this node is sent back
+    together with the shorter turn_prompt, so only the new tokens have to be
+    prefilled.
+    label names the call in streamed tokens, spans and the KV context store
+    when one node makes several calls, e.g. one per target language.
+    """
+    writer = _stream_writer() if stream else None
+    listener = token_listener.get()
+    llm = get_llm()
+
+    route = NODE_ROUTES.get(node, "")
+    name = label or node
+    kv_enabled = kv_reuse_enabled(session_id, llm)
+    reuse = kv_contexts.get(session_id, name) if kv_enabled else None
+
+    def replay(text: str):
+        # Hand a ready-made answer to any consumers as a single token
+        if writer:
+            writer({"node": name, "token": text})
+        if listener:
+            listener(text)
+
+    with span("llm", node=name, route=route) as record:
+        key = cache_key(llm.model, llm_params(llm), prompt)
+        # A continued context changes the answer, so those calls bypass the cache
+        use_cache = LLM_CACHE_ENABLED and route not in CACHE_SKIP_ROUTES and reuse is None
+        if use_cache:
+            cached = get_llm_cache().get(key)
+            record["cache_hit"] = cached is not None
+            if cached is not None:
+                logger.info(f"LLM cache hit for {name}")
+                replay(cached)
+                return cached
+
+        def on_done(chunk: Dict[str, Any]):
+            record["prompt_tokens"] = chunk.get("prompt_eval_count", 0)
+            record["prefill_ms"] = chunk.get("prompt_eval_duration", 0) / 1e6
+            kv_contexts.put(session_id, name, chunk.get("context"), chunk.get("host"))
+
+        chunks: List[str] = []
+
+        budget = current_budget.get()
+        deadline = budget.deadline if budget is not None else None
+        hedge_after = latency_tracker.percentile(name, HEDGE_PERCENTILE) if HEDGE_REQUESTS else None
+        # Hedged attempts run on workers sized to what the backend can serve at once
+        capacity = llm_capacity(llm)
+
+        def emit(token: str):
+            chunks.append(token)
+            if writer:
+                writer({"node": name, "token": token})
+            if listener:
+                listener(token)
+
+        def call(text: str, context: Optional[KVContext]) -> str:
+            kwargs = {}
+            if kv_enabled:
+                kwargs = {"context": context.tokens if context else None,
+                          "prefer_host": context.host if context else None,
+                          "on_done": on_done}
+            if deadline is not None and getattr(llm, "supports_deadline", False):
+                kwargs["deadline"] = deadline
+            start = time.perf_counter()
+            try:
+                for token in hedged_stream(lambda: llm.stream(text, **kwargs), deadline, hedge_after,
+                                           capacity=capacity):
+                    if not chunks:
+                        # Separates queueing and prefill from generation time
+                        record["ttft_ms"] = (time.perf_counter() - start) * 1000
+                        latency_tracker.observe(name, time.perf_counter() - start)
+                    emit(token)
+                record["tokens"] = len(chunks)
+            except DeadlineExceeded:
+                record["deadline_exceeded"] = True
+                if budget is not None:
+                    budget.exceeded = True
+                if not chunks:
+                    raise
+                # Keep what was generated so the partial answer still reaches final_node
+                logger.warning(f"{name} ran out of time after {len(chunks)} tokens")
+                record["tokens"] = len(chunks)
+                emit(TRUNCATED_NOTE)
+            return "".join(chunks)
+
+        if reuse is None:
+            def run() -> Tuple[str, bool]:
+                text = call(prompt, None)
+                return text, bool(record.get("deadline_exceeded"))
+
+            # Identical prompts in flight at the same time share one generation
+            try:
+                (response, truncated), shared = (llm_flights.do(key, run, deadline) if COALESCE_REQUESTS
+                                                 else (run(), False))
+            except DeadlineExceeded:
+                # Also covers waiting on another caller's generation past this budget
+                record["deadline_exceeded"] = True
+                if budget is not None:
+                    budget.exceeded = True
+                raise
+            if shared and truncated:
+                # The leader ran out of its own budget; this caller may still have time left
+                logger.info(f"Shared LLM call for {name} was cut short, generating again")
+                response, truncated = run()
+            elif shared:
+                record["coalesced"] = True
+                logger.info(f"Coalesced LLM call for {name}")
+                replay(response)
+        else:
+            try:
+                response = call(turn_prompt or prompt, reuse)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                if chunks:
+                    raise
+                # The stored context was rejected; forget it and fall back to the full prompt
+                logger.warning(f"Reusing KV context for {name} failed ({e}), retrying with the full prompt")
+                kv_contexts.discard(session_id, name)
+                reuse = None
+                response = call(prompt, None)
+
+        if kv_enabled:
+            record["kv_reuse"] = reuse is not None
+            if reuse is not None:
+                record["prefill_saved_tokens"] = len(reuse.tokens)
+
+        if use_cache and not record.get("deadline_exceeded"):
+            get_llm_cache().put(key, response)
+        return response
+
+def router_node(state: GraphState) -> Dict[str, Any]:
     """Route the query to appropriate processing nodes"""
     query = state['input'].lower()
-    logger.info(f"Router processing: {query}")
-
-    # Enhanced pattern matching for different operations
-    math_patterns = [
-        r'\b(calculate|compute|solve|find|what is)\b',
-        r'\d+\s*[\+\-\*\/]\s*\d+',
-        r'\bsquare root\b',
-        r'\b(add|subtract|multiply|divide)\b',
-        r'\b(sum|difference|product|quotient)\b'
-    ]
-
-    write_patterns = [
-        r'\b(write|create|compose|tell)\b.*\b(story|tale|poem|essay|narrative)\b',
-        r'\bwrite\b',
-        r'\bstory\b',
-        r'\bpoem\b',
-        r'\bessay\b'
-    ]
-
-    translate_patterns = [
-        r'\b(translate|translation|convert)\b',
-        r'\bto\s+(spanish|french|german|italian|portuguese|chinese|japanese|korean|hindi|arabic)\b',
-        r'\bin\s+(spanish|french|german|italian|portuguese|chinese|japanese|korean|hindi|arabic)\b'
-    ]
+    node_logger.info(f"Router processing: {query[:LOG_QUERY_CHARS]}", extra={"query_chars": len(query)})
 
-    has_math = any(re.search(pattern, query) for pattern in math_patterns)
-    has_write = any(re.search(pattern, query) for pattern in write_patterns)
-    has_translate = any(re.search(pattern, query) for pattern in translate_patterns)
-
-    # Determine route based on patterns
-    routes = []
-    if has_math:
-        routes.append("math")
-    if has_write:
-        routes.append("write")
-    if has_translate:
-        routes.append("translate")
-
-    if len(routes) > 1:
-        state['route'] = "multi"
-        state['sub_routes'] = routes
-    elif len(routes) == 1:
-        state['route'] = routes[0]
-    else:
-        state['route'] = "default"
+    # Single-pass routing with the precompiled router
+    decision = router.route(query)
+    update: Dict[str, Any] = {'route': decision.route, 'sub_routes': decision.sub_routes or []}
+    if decision.target_language:
+        update['target_language'] = decision.target_language
+        update['target_languages'] = decision.target_languages
 
-    # Add context from memory
-    context = memory.get_context(query)
-    if context:
-        state['memory_context'] = context
+    # Add context from memory, capped by the route's token budget
+    with span("memory.get_context", node="router", route=decision.route) as record:
+        context = build_context(get_memory(state.get('session_id', DEFAULT_SESSION)), query, decision.route)
+        record["context_tokens"] = estimate_tokens(context)
+    update['memory_context'] = context
 
-    logger.info(f"Router detected route: {state['route']}")
-    return state
+    logger.info(f"Router detected route: {decision.route}")
+    return update
 
-def math_node(state: Dict[str, Any]) -> Dict[str, Any]:
+def math_node(state: GraphState) -> Dict[str, Any]:
     """Handle mathematical calculations"""
     query = state['input']
-    logger.info(f"Math node processing: {query}")
+    node_logger.info("Math node processing")
 
     math_result = ""
+    math_exact = False
 
-    # Pattern matching for basic operations
-    patterns = [
-        (r'(\d+)\s*\+\s*(\d+)', lambda a, b: f"{a} + {b} = {int(a) + int(b)}"),
-        (r'(\d+)\s*\-\s*(\d+)', lambda a, b: f"{a} - {b} = {int(a) - int(b)}"),
-        (r'(\d+)\s*\*\s*(\d+)', lambda a, b: f"{a} * {b} = {int(a) * int(b)}"),
-        (r'(\d+)\s*\/\s*(\d+)', lambda a, b: f"{a} / {b} = {float(a) / float(b)}" if int(b) != 0 else "Cannot divide by zero"),
-        (r'square root of (\d+)', lambda a: f"Square root of {a} = {float(a) ** 0.5}")
-    ]
-
-    for pattern, calc_func in patterns:
-        match = re.search(pattern, query)
-        if match:
-            try:
-                if "square root" in pattern:
-                    math_result = calc_func(float(match.group(1)))
-                else:
-                    math_result = calc_func(match.group(1), match.group(2))
-                break
-            except Exception as e:
-                math_result = f"Error in calculation: {str(e)}"
-                logger.error(f"Math calculation error: {e}")
+    # Exact arithmetic engine; only unrecognised problems go to the LLM
+    try:
+        solved = math_engine.solve(query)
+        if solved is not None:
+            math_result = str(solved)
+            math_exact = True
+    except math_engine.MathError as e:
+        math_result = f"Error in calculation: {str(e)}"
+        logger.error(f"Math calculation error: {e}")
 
     if not math_result:
         try:
-            context = state.get('memory_context', '')
-            prompt = f"""Previous context: {context}
-
-Please solve this math problem and provide a clear answer: {query}"""
-            math_result = llm.invoke(prompt)
+            prompt, turn_prompt = _node_prompt(
+                "Please solve this math problem and provide a clear answer.",
+                f"Problem: {query}",
+                state.get('memory_context', '')
+            )
+            math_result = generate(prompt, "math_node", session_id=state.get('session_id'),
+                                   turn_prompt=turn_prompt)
         except Exception as e:
             math_result = f"Error calculating: {str(e)}"
             logger.error(f"LLM math error: {e}")
 
-    state['math_result'] = math_result
     logger.info(f"Math result generated: {len(math_result)} characters")
-    return state
+    return {'math_result': math_result, 'math_exact': math_exact}
 
-def writer_node(state: Dict[str, Any]) -> Dict[str, Any]:
+def writer_node(state: GraphState) -> Dict[str, Any]:
     """Handle creative writing tasks"""
     query = state['input']
-    logger.info(f"Writer node processing: {query}")
+    node_logger.info("Writer node processing")
 
     math_context = state.get('math_result', '')
     memory_context = state.get('memory_context', '')
 
     try:
         if math_context:
-            prompt = f"""Previous context: {memory_context}
-
-Write a creative story that incorporates this math result: {math_context}
+            request = f"""Write a creative story that incorporates this math result: {math_context}
 
 Original request: {query}
 
 Please create an engaging story that naturally includes the mathematical calculation."""
         else:
-            prompt = f"""Previous context: {memory_context}
+            request = f"Request: {query}"
 
-Create engaging creative content based on this request: {query}"""
-
-        story = llm.invoke(prompt)
-        state['story'] = story
+        prompt, turn_prompt = _node_prompt("Create engaging creative content based on the request below.",
+                                           request, memory_context)
+        story = generate(prompt, "writer_node", session_id=state.get('session_id'), turn_prompt=turn_prompt)
         logger.info(f"Story created: {len(story)} characters")
 
     except Exception as e:
-        state['story'] = f"Error creating story: {str(e)}"
+        story = f"Error creating story: {str(e)}"
         logger.error(f"Writer error: {e}")
 
-    return state
+    return {'story': story}
 
-def translator_node(state: Dict[str, Any]) -> Dict[str, Any]:
-    """Handle translation tasks"""
+def translator_node(state: GraphState) -> Dict[str, Any]:
+    """Handle translation tasks into every requested language"""
     query = state['input']
-    logger.info(f"Translator node processing: {query}")
-
-    languages = {
-        'spanish': 'Spanish', 'french': 'French', 'german': 'German',
-        'italian': 'Italian', 'portuguese': 'Portuguese', 'chinese': 'Chinese',
-        'japanese': 'Japanese', 'korean': 'Korean', 'hindi': 'Hindi', 'arabic': 'Arabic'
-    }
+    node_logger.info("Translator node processing")
 
-    target_language = None
-    for lang_key, lang_name in languages.items():
-        if re.search(rf'\b(to|in)\s+{lang_key}\b', query.lower()):
-            target_language = lang_name
-            break
-
-    if not target_language:
-        target_language = "Spanish"  # Default
+    target_languages = _target_languages(state)
 
     try:
         content_to_translate = ""
@@ -179,54 +386,298 @@ def translator_node(state: Dict[str, Any]) -> Dict[str, Any]:
             content_to_translate += f"Story: {state['story']}\n"
 
         if not content_to_translate:
-            translate_match = re.search(r'translate\s+"([^"]+)"', query)
-            if translate_match:
-                content_to_translate = translate_match.group(1)
-            else:
-                content_to_translate = query
-
-        memory_context = state.get('memory_context', '')
-        prompt = f"""Previous context: {memory_context}
-
-Please translate the following content to {target_language}:
+            content_to_translate = quoted_text(query) or query
 
-{content_to_translate}
-
-Provide a natural, accurate translation."""
-
-        translation = llm.invoke(prompt)
-        state['translation'] = translation
-        state['target_language'] = target_language
-        logger.info(f"Translation to {target_language} completed: {len(translation)} characters")
+        # Exact engine results are rendered from phrase tables; only the rest needs the LLM
+        translations = _localize_math(state, target_languages)
+        remaining = [language for language in target_languages if language not in translations]
+        if remaining:
+            translations.update(_translate_all(content_to_translate, remaining, state))
+        translations = {language: translations[language] for language in target_languages}
+        logger.info(f"Translation to {', '.join(target_languages)} completed: "
+                    f"{sum(len(t) for t in translations.values())} characters")
 
     except Exception as e:
-        state['translation'] = f"Error translating: {str(e)}"
+        translations = {language: f"Error translating: {str(e)}" for language in target_languages}
         logger.error(f"Translation error: {e}")
 
-    return state
+    return {
+        'translations': translations,
+        'target_languages': target_languages,
+        # Single-language fields, kept for callers that only expect one translation
+        'translation': translations[target_languages[0]],
+        'target_language': target_languages[0]
+    }
+
+def _target_languages(state: Dict[str, Any]) -> List[str]:
+    """Every language the query asks for, in order, defaulting to DEFAULT_LANGUAGE"""
+    return state.get('target_languages') or router.detect_languages(state['input']) or [DEFAULT_LANGUAGE]
+
+def _language_label(language: str, languages: List[str]) -> str:
+    """Stream and span name of one language's translation"""
+    return "translator_node" if len(languages) == 1 else f"translator_node ({language})"
+
+def _localize_math(state: Dict[str, Any], languages: List[str]) -> Dict[str, str]:
+    """Localise an exact math result without an LLM when it is all there is to translate"""
+    if not state.get('math_exact') or state.get('story'):
+        return {}
+
+    with span("localize", node="translator_node", route=state.get('route', '')):
+        localized = {language: localize_math_result(state['math_result'], language) for language in languages}
+
+    writer = _stream_writer()
+    translations = {}
+    for language, text in localized.items():
+        if text is None:
+            continue
+        translations[language] = text
+        if writer:
+            writer({"node": _language_label(language, languages), "token": text})
+    logger.info(f"Localised math result for {', '.join(translations) or 'no languages'}")
+    return translations
+
+def _translate_one(content: str, language: str, state: Dict[str, Any], label: Optional[str] = None) -> str:
+    prompt, turn_prompt = _translation_prompt(content, language, state.get('memory_context', ''))
+    return generate(prompt, "translator_node", session_id=state.get('session_id'),
+                    turn_prompt=turn_prompt, label=label)
+
+def _translate_all(content: str, languages: List[str], state: Dict[str, Any]) -> Dict[str, str]:
+    """Translate content into every target language within one node run"""
+    if len(languages) == 1:
+        return {languages[0]: _translate_one(content, languages[0], state)}
+
+    translations: Dict[str, str] = {}
+    if MULTI_LANGUAGE_MODE == "structured":
+        translations = _translate_structured(content, languages, state)
+
+    # One concurrent call per language not already covered by the structured reply
+    executor = fanout_executor("language")
+    futures = {
+        language: executor.submit(contextvars.copy_context().run, _translate_one, content, language,
+                                  state, _language_label(language, languages))
+        for language in languages if language not in translations
+    }
+    for language, future in futures.items():
+        try:
+            translations[language] = future.result()
+        except Exception as e:
+            translations[language] = f"Error translating: {str(e)}"
+            logger.error(f"Translation to {language} failed: {e}")
+
+    return {language: translations[language] for language in languages}
+
+def _translate_structured(content: str, languages: List[str], state: Dict[str, Any]) -> Dict[str, str]:
+    """Ask for every language in a single JSON reply, returning the translations that parse"""
+    prompt, turn_prompt = _node_prompt(
+        f"Translate the content below into each of these languages: {', '.join(languages)}. "
+        "Reply with only a JSON object that maps each language name to its translation.",
+        content,
+        state.get('memory_context', '')
+    )
+    try:
+        reply = generate(prompt, "translator_node", stream=False, session_id=state.get('session_id'),
+                         turn_prompt=turn_prompt, label="translator_node (structured)")
+        parsed = json.loads(reply[reply.index("{"):reply.rindex("}") + 1])
+    except Exception as e:
+        logger.warning(f"Structured translation failed, translating per language: {e}")
+        return {}
+
+    by_name = {str(key).strip().lower(): value for key, value in parsed.items()} if isinstance(parsed, dict) else {}
+    translations = {language: str(by_name[language.lower()]).strip()
+                    for language in languages if by_name.get(language.lower())}
+
+    writer = _stream_writer()
+    if writer:
+        for language, text in translations.items():
+            writer({"node": _language_label(language, languages), "token": text})
+    return translations
+
+def _node_prompt(instructions: str, request: str, memory_context: str) -> Tuple[str, str]:
+    """Build a full prompt and the shorter follow-up sent on top of a reused Ollama context
+
+    The fixed instructions come first so that consecutive prompts of a node
+    share a prefix Ollama still has in its KV cache.
+    """
+    prompt = f"""{instructions}
+
+Previous context: {memory_context}
+
+{request}"""
+    return prompt, f"{instructions}\n\n{request}"
+
+def _translation_prompt(content: str, target_language: str, memory_context: str) -> Tuple[str, str]:
+    """Build the translation prompts shared by translator_node and the pipeline"""
+    return _node_prompt(
+        f"Please translate the following content to {target_language}. Provide a natural, accurate translation.",
+        content,
+        memory_context
+    )
 
-def default_node(state: Dict[str, Any]) -> Dict[str, Any]:
+def default_node(state: GraphState) -> Dict[str, Any]:
     """Handle general queries"""
     query = state['input']
-    logger.info(f"Default node processing: {query}")
+    node_logger.info("Default node processing")
 
     try:
-        memory_context = state.get('memory_context', '')
-        prompt = f"""Previous context: {memory_context}
+        prompt, turn_prompt = _node_prompt("Please provide a helpful response to the request below.",
+                                           f"Request: {query}", state.get('memory_context', ''))
 
-Please provide a helpful response to: {query}"""
-
-        response = llm.invoke(prompt)
-        state['default_result'] = response
+        response = generate(prompt, "default_node", session_id=state.get('session_id'), turn_prompt=turn_prompt)
         logger.info(f"Default response generated: {len(response)} characters")
 
     except Exception as e:
-        state['default_result'] = f"Error generating response: {str(e)}"
+        response = f"Error generating response: {str(e)}"
         logger.error(f"Default node error: {e}")
 
-    return state
+    return {'default_result': response}
+
+def multi_node(state: GraphState) -> Dict[str, Any]:
+    """Run multi-route sub-tasks stage by stage, fanning each stage's branches out concurrently
+
+    Only plans where a later stage needs an earlier one's output get here;
+    fully independent sub-routes run as parallel graph branches instead.
+    """
+    stages = plan_stages(state['input'], state.get('sub_routes', []))
+    logger.info(f"Multi node execution plan: {stages}")
+
+    deps = build_dependencies(state['input'], state.get('sub_routes', []))
+    skip_translate = False
+
+    # Later stages read what earlier ones produced; only the new keys are returned
+    view: Dict[str, Any] = dict(state)
+    update: Dict[str, Any] = {}
+
+    def merge(outputs: Dict[str, Any]):
+        apply_update(view, outputs)
+        apply_update(update, outputs)
+
+    for i, stage in enumerate(stages):
+        if stage == ['translate'] and skip_translate:
+            continue
+
+        # Stream the story straight into the translator when it is the only input left
+        next_stage = stages[i + 1] if i + 1 < len(stages) else []
+        if (PIPELINE_TRANSLATION and stage == ['write'] and next_stage == ['translate']
+                and 'write' in deps['translate']):
+            merge(_run_pipelined_write_translate(view, len(stages) - i))
+            skip_translate = True
+            continue
+
+        stages_left = len(stages) - i
+        if len(stage) == 1:
+            merge(_run_branch(stage[0], view, stages_left))
+            continue
+
+        # Branches only read the state and return their own keys; results are
+        # merged once the whole stage is done so no branch sees a sibling's output
+        executor = fanout_executor("branch")
+        futures = [
+            executor.submit(contextvars.copy_context().run, _run_branch, route, view, stages_left)
+            for route in stage
+        ]
+        for outputs in [future.result() for future in futures]:
+            merge(outputs)
+
+    return update
+
+def _run_branch(route: str, state: GraphState, stages_left: int = 1) -> Dict[str, Any]:
+    """Run a single sub-route node and return the keys it produces
+
+    The node gets an even share, with the stages_left - 1 stages after it, of
+    what is left of multi_node's budget, which already excludes final_node's reserve.
+    """
+    node = BRANCH_NODES[route]
+    outer = current_deadline()
+    if outer is not None:
+        deadline = node_deadline(outer, stages_left, reserve=0.0)
+    else:
+        deadline = node_deadline(state.get('deadline'), stages_left)
+    with span("branch", node=node.__name__, route=route), budget_scope(deadline) as budget:
+        outputs = node(state)
+    if budget.exceeded:
+        logger.warning(f"{node.__name__} exceeded its time budget")
+        outputs['timeouts'] = [node.__name__]
+    return outputs
+
+def _run_pipelined_write_translate(state: GraphState, stages_left: int = 2) -> Dict[str, Any]:
+    """Generate the story and translate each finished chunk while the rest streams
+
+    stages_left counts the write and translate stages together with any
+    after them. The writer gets one stage's share of multi_node's budget;
+    translations may run until the end of the translate stage's share, so the
+    chunks left when the story ends still have time.
+    """
+    target_languages = _target_languages(state)
+    memory_context = state.get('memory_context', '')
+    writer = _stream_writer()
+    outer = current_deadline()
+    if outer is not None:
+        write_deadline = node_deadline(outer, stages_left, reserve=0.0)
+        translate_deadline = node_deadline(outer, stages_left - 1, reserve=0.0)
+    else:
+        write_deadline = node_deadline(state.get('deadline'), stages_left)
+        translate_deadline = node_deadline(state.get('deadline'), stages_left - 1)
+    translate_budget = Budget(translate_deadline)
+
+    def make_pipeline(language: str) -> PipelinedTranslator:
+        label = _language_label(language, target_languages)
 
-def final_node(state: Dict[str, Any]) -> Dict[str, Any]:
+        def translate_chunk(text: str) -> str:
+            prompt, _ = _translation_prompt(text, language, memory_context)
+            # Pipeline workers do not inherit this context, so hand them the translations' budget
+            token = current_budget.set(translate_budget)
+            try:
+                return generate(prompt, "translator_node", stream=False)
+            finally:
+                current_budget.reset(token)
+
+        def emit_chunk(text: str):
+            if writer:
+                writer({"node": label, "token": text})
+
+        return PipelinedTranslator(translate_chunk, max_in_flight=TRANSLATION_CONCURRENCY, on_chunk=emit_chunk)
+
+    # Every language gets its own pipeline fed from the same story stream
+    pipelines = {language: make_pipeline(language) for language in target_languages}
+    if state.get('math_result'):
+        for pipeline in pipelines.values():
+            pipeline.submit(f"Math: {state['math_result']}")
+
+    def feed(story_token: str):
+        for pipeline in pipelines.values():
+            pipeline.feed(story_token)
+
+    token = token_listener.set(feed)
+    try:
+        with budget_scope(write_deadline) as write_budget:
+            result = writer_node(state)
+    finally:
+        token_listener.reset(token)
+
+    translations = {}
+    for language, pipeline in pipelines.items():
+        try:
+            _, translations[language] = pipeline.finish()
+            logger.info(f"Pipelined translation to {language} completed: {len(translations[language])} characters")
+        except Exception as e:
+            translations[language] = f"Error translating: {str(e)}"
+            logger.error(f"Pipelined translation error: {e}")
+
+    outputs = {
+        'story': result['story'],
+        'translations': translations,
+        'target_languages': target_languages,
+        'translation': translations[target_languages[0]],
+        'target_language': target_languages[0]
+    }
+    timeouts = [name for name, part in (("writer_node", write_budget), ("translator_node", translate_budget)) if part.exceeded]
+    for name in timeouts:
+        logger.warning(f"{name} exceeded its time budget")
+    if timeouts:
+        outputs['timeouts'] = timeouts
+    return outputs
+
+def final_node(state: GraphState) -> Dict[str, Any]:
     """Combine results and generate final output"""
     route = state['route']
     logger.info(f"Final node processing route: {route}")
@@ -240,81 +691,98 @@ def final_node(state: Dict[str, Any]) -> Dict[str, Any]:
         if 'write' in sub_routes and state.get('story'):
             output_parts.append(f"CREATIVE STORY:\n{state['story']}")
         if 'translate' in sub_routes and state.get('translation'):
-            target_lang = state.get('target_language', 'Unknown')
-            output_parts.append(f"TRANSLATION ({target_lang}):\n{state['translation']}")
+            for target_lang, translation in _translations(state).items():
+                output_parts.append(f"TRANSLATION ({target_lang}):\n{translation}")
     elif route == "math":
         output_parts.append(state.get('math_result', 'No math result available'))
     elif route == "write":
         output_parts.append(state.get('story', 'No story available'))
     elif route == "translate":
-        target_lang = state.get('target_language', 'Unknown')
-        output_parts.append(f"Translation to {target_lang}:\n{state.get('translation', 'No translation available')}")
+        for target_lang, translation in _translations(state).items():
+            output_parts.append(f"Translation to {target_lang}:\n{translation}")
     else:
         output_parts.append(state.get('default_result', 'No response available'))
 
+    if state.get('timeouts'):
+        output_parts.append(f"NOTE: {', '.join(state['timeouts'])} ran out of time; results above may be incomplete.")
+
     final_output = "\n\n".join(output_parts)
-    state['final_output'] = final_output
 
     # Save to memory
-    memory.add_conversation(
-        query=state['input'],
-        response=final_output,
-        route=route,
-        metadata={
-            'has_math': bool(state.get('math_result')),
-            'has_story': bool(state.get('story')),
-            'has_translation': bool(state.get('translation')),
-            'target_language': state.get('target_language')
-        }
-    )
+    record_conversation({**state, 'final_output': final_output})
 
     logger.info(f"Final output generated: {len(final_output)} characters")
-    return state
-
-def create_router_condition(state: Dict[str, Any]) -> Literal[
-    "math_node", "writer_node", "translator_node", "default_node"]:
-    """Determine which node to route to from the router"""
+    return {'final_output': final_output}
+
+def record_conversation(state: Dict[str, Any]):
+    """Save a finished request to its session's memory"""
+    with span("memory.add_conversation", node="final_node", route=state['route']):
+        get_memory(state.get('session_id', DEFAULT_SESSION)).add_conversation(
+            query=state['input'],
+            response=state['final_output'],
+            route=state['route'],
+            metadata={
+                'has_math': bool(state.get('math_result')),
+                'has_story': bool(state.get('story')),
+                'has_translation': bool(state.get('translation')),
+                'target_language': state.get('target_language'),
+                'target_languages': state.get('target_languages', [])
+            }
+        )
+
+def _translations(state: Dict[str, Any]) -> Dict[str, str]:
+    """Translations by language, falling back to the single-language fields"""
+    if state.get('translations'):
+        return state['translations']
+    return {state.get('target_language') or 'Unknown': state.get('translation') or 'No translation available'}
+
+# Node that handles each sub-route of a multi query
+BRANCH_NODES = {
+    "math": math_node,
+    "write": writer_node,
+    "translate": translator_node,
+}
+
+def create_router_condition(state: GraphState) -> Union[Literal[
+        "math_node", "writer_node", "translator_node", "multi_node", "default_node"], List[str]]:
+    """Determine which node, or parallel nodes, to route to from the router"""
     route = state['route']
-    if route == "math":
+    if route == "multi":
+        # Sub-routes that need nothing from each other run as parallel graph
+        # branches whose partial updates are merged before final_node
+        stages = plan_stages(state['input'], state.get('sub_routes', []))
+        if len(stages) == 1 and len(stages[0]) > 1:
+            return [BRANCH_NODES[sub_route].__name__ for sub_route in stages[0]]
+        return "multi_node"
+    elif route == "math":
         return "math_node"
     elif route == "write":
         return "writer_node"
     elif route == "translate":
         return "translator_node"
-    elif route == "multi":
-        sub_routes = state.get('sub_routes', [])
-        if 'math' in sub_routes:
-            return "math_node"
-        elif 'write' in sub_routes:
-            return "writer_node"
-        elif 'translate' in sub_routes:
-            return "translator_node"
     return "default_node"
 
-def create_multi_condition(state: Dict[str, Any]) -> Literal["writer_node", "translator_node", "final_node"]:
-    """Handle multi-route logic"""
-    if state['route'] == "multi":
-        sub_routes = state.get('sub_routes', [])
-        if 'write' in sub_routes and not state.get('story'):
-            return "writer_node"
-        elif 'translate' in sub_routes and not state.get('translation'):
-            return "translator_node"
-    return "final_node"
-
 def create_graph():
     """Create and configure the LangGraph"""
+    from langgraph.graph import StateGraph
+
     logger.info("Creating LangGraph...")
 
-    # Initialize the graph
-    graph = StateGraph(dict)
+    # Expose span histograms for Prometheus when a port is configured
+    if os.getenv("METRICS_PORT"):
+        start_metrics_server(int(os.getenv("METRICS_PORT")))
+
+    # Initialize the graph; nodes return partial updates merged per GraphState
+    graph = StateGraph(GraphState)
 
     # Add all nodes
-    graph.add_node("router", router_node)
-    graph.add_node("math_node", math_node)
-    graph.add_node("writer_node", writer_node)
-    graph.add_node("translator_node", translator_node)
-    graph.add_node("default_node", default_node)
-    graph.add_node("final_node", final_node)
+    graph.add_node("router", traced_node("router", router_node))
+    graph.add_node("math_node", traced_node("math_node", deadline_node("math_node", math_node)))
+    graph.add_node("writer_node", traced_node("writer_node", deadline_node("writer_node", writer_node)))
+    graph.add_node("translator_node", traced_node("translator_node", deadline_node("translator_node", translator_node)))
+    graph.add_node("multi_node", traced_node("multi_node", deadline_node("multi_node", multi_node)))
+    graph.add_node("default_node", traced_node("default_node", deadline_node("default_node", default_node)))
+    graph.add_node("final_node", traced_node("final_node", final_node))
 
     # Set entry point
     graph.set_entry_point("router")
@@ -327,32 +795,16 @@ def create_graph():
             "math_node": "math_node",
             "writer_node": "writer_node",
             "translator_node": "translator_node",
+            "multi_node": "multi_node",
             "default_node": "default_node"
         }
     )
 
-    # Add conditional edges for multi-route processing
-    graph.add_conditional_edges(
-        "math_node",
-        create_multi_condition,
-        {
-            "writer_node": "writer_node",
-            "translator_node": "translator_node",
-            "final_node": "final_node"
-        }
-    )
-
-    graph.add_conditional_edges(
-        "writer_node",
-        create_multi_condition,
-        {
-            "translator_node": "translator_node",
-            "final_node": "final_node"
-        }
-    )
-
-    # Add direct edges to final_node
+    # Every processing node joins at final_node
+    graph.add_edge("math_node", "final_node")
+    graph.add_edge("writer_node", "final_node")
     graph.add_edge("translator_node", "final_node")
+    graph.add_edge("multi_node", "final_node")
     graph.add_edge("default_node", "final_node")
 
     # Set finish point
@@ -361,6 +813,86 @@ def create_graph():
     logger.info("LangGraph created successfully")
     return graph.compile()
 
+def get_app():
+    """Return the compiled graph, building it once per process"""
+    global _app
+    if _app is None:
+        with _init_lock:
+            if _app is None:
+                _app = create_graph()
+    return _app
+
+def make_initial_state(query: str, session_id: str = DEFAULT_SESSION) -> GraphState:
+    """Build the state for a new query; nodes fill in the remaining fields"""
+    return {
+        "input": query,
+        "session_id": session_id,
+        "request_id": uuid.uuid4().hex,
+        "deadline": request_deadline()
+    }
+
+def request_key(query: str, session_id: str = DEFAULT_SESSION) -> str:
+    """Key under which identical concurrent requests are coalesced
+
+    Two requests match when their normalised input and the memory context
+    they would be answered with are the same. Sessions whose LLM calls
+    continue their own Ollama contexts are answered from conversation history
+    that memory_context does not show, so they only match themselves.
+    """
+    normalized = normalize_prompt(query).lower()
+    context = build_context(get_memory(session_id), normalized, router.route(normalized).route)
+    scope = session_id if kv_reuse_enabled(session_id) else ""
+    return cache_key("graph", {}, f"{scope}\n{normalized}\n{context}")
+
+def _stream_graph(app, initial_state: Dict[str, Any]) -> Iterator[Tuple[str, Any]]:
+    result = initial_state
+    for mode, chunk in app.stream(initial_state, stream_mode=["custom", "values"]):
+        if mode == "custom":
+            yield "token", chunk
+        else:
+            result = chunk
+    yield "result", result
+
+def stream_query(app, initial_state: Dict[str, Any]) -> Iterator[Tuple[str, Any]]:
+    """Run the graph, yielding ("token", event) pairs and finally ("result", state)
+
+    A request identical to one already running replays that run's events
+    instead of executing the graph again, then records its own turn in memory.
+    """
+    if not COALESCE_REQUESTS:
+        yield from _stream_graph(app, initial_state)
+        return
+
+    key = request_key(initial_state['input'], initial_state.get('session_id', DEFAULT_SESSION))
+    events, leader = graph_flights.stream(key, lambda: _stream_graph(app, initial_state))
+    streamed = False
+    try:
+        for kind, payload in events:
+            if kind == "result" and not leader:
+                logger.info("Served request from an identical in-flight run",
+                            extra={"request_id": initial_state.get('request_id')})
+                payload = {**payload, 'session_id': initial_state.get('session_id', DEFAULT_SESSION),
+                           'request_id': initial_state.get('request_id'), 'trace': []}
+                record_conversation(payload)
+            streamed = streamed or kind == "token"
+            yield kind, payload
+    except FlightAbandoned:
+        # The leader's caller went away (e.g. a Streamlit rerun); run this request
+        # itself, without repeating tokens if some of the shared run were already sent
+        logger.info("Shared run was abandoned, running the request again",
+                    extra={"request_id": initial_state.get('request_id')})
+        for kind, payload in _stream_graph(app, initial_state):
+            if kind == "result" or not streamed:
+                yield kind, payload
+
+def run_query(app, initial_state: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the graph to completion and return the final state"""
+    result = initial_state
+    for kind, payload in stream_query(app, initial_state):
+        if kind == "result":
+            result = payload
+    return result
+
 def main():
     """Main function to test the enhanced router system"""
     print("🚀 Creating Enhanced LangGraph Router System...")
@@ -369,7 +901,7 @@ def main():
     # Create graph visualization
     visualize_graph()
 
-    app = create_graph()
+    app = get_app()
 
     # Enhanced test cases
     test_queries = [
@@ -387,23 +919,21 @@ def main():
 
         try:
             # Initialize state
-            initial_state = {
-                "input": query,
-                "route": "",
-                "sub_routes": [],
-                "math_result": "",
-                "story": "",
-                "translation": "",
-                "target_language": "",
-                "default_result": "",
-                "memory_context": "",
-                "final_output": ""
-            }
-
-            # Execute the graph
-            result = app.invoke(initial_state)
-
-            print(f"\n📝 FINAL OUTPUT:")
+            initial_state = make_initial_state(query)
+
+            # Execute the graph, printing tokens as each node generates them
+            result = initial_state
+            current_node = None
+            for kind, payload in stream_query(app, initial_state):
+                if kind == "result":
+                    result = payload
+                    continue
+                if payload['node'] != current_node:
+                    current_node = payload['node']
+                    print(f"\n\n⏳ {current_node}:", flush=True)
+                print(payload['token'], end="", flush=True)
+
+            print(f"\n\n📝 FINAL OUTPUT:")
             print(f"{'-' * 60}")
             print(result['final_output'])
 
@@ -413,7 +943,7 @@ def main():
 
         print(f"{'=' * 80}")
 
-    print(f"\n💾 Memory contains {len(memory.conversations)} conversations")
+    print(f"\n💾 Memory contains {len(get_memory().conversations)} conversations")
     print(f"📊 Graph visualization saved as 'graph_structure.png'")
     print(f"📋 Logs saved to 'langgraph_router.log'")
     print(f"🧠 Memory saved to 'memory.json'")
@@ -0,0 +1,357 @@
+import ast
+import math
+import operator
+import re
+from decimal import Decimal, localcontext
+from fractions import Fraction
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Union
+
+Number = Union[Fraction, float]
+
+# Guards against expressions that would take unbounded time or memory
+MAX_EXPRESSION_LENGTH = 200
+MAX_EXPONENT = 10000
+MAX_FACTORIAL = 1000
+# Largest numerator or denominator, in bits, of any intermediate result;
+# about 3000 decimal digits, well inside Python's int-to-str limit
+MAX_RESULT_BITS = 10000
+
+
+class MathError(ValueError):
+    """Raised for expressions that cannot be evaluated safely"""
+
+
+class MathResult(NamedTuple):
+    """An evaluated expression found in a query"""
+    expression: str
+    value: Number
+
+    def __str__(self) -> str:
+        return f"{self.expression} = {format_number(self.value)}"
+
+
+def _sqrt(x: Number) -> Number:
+    if x < 0:
+        raise MathError("Cannot take the square root of a negative number")
+    if isinstance(x, Fraction):
+        num, den = math.isqrt(x.numerator), math.isqrt(x.denominator)
+        if num * num == x.numerator and den * den == x.denominator:
+            return Fraction(num, den)
+    return math.sqrt(x)
+
+
+def _icbrt(n: int) -> int:
+    """Largest integer whose cube is at most n, for n >= 0"""
+    if n < 2:
+        return n
+    x = 1 << -(-n.bit_length() // 3)
+    while True:
+        y = (2 * x + n // (x * x)) // 3
+        if y >= x:
+            return x
+        x = y
+
+
+def _cbrt(x: Number) -> Number:
+    if isinstance(x, Fraction):
+        num, den = _icbrt(abs(x.numerator)), _icbrt(x.denominator)
+        if num ** 3 == abs(x.numerator) and den ** 3 == x.denominator:
+            return Fraction(num, den) if x >= 0 else -Fraction(num, den)
+    return math.copysign(abs(float(x)) ** (1 / 3), x)
+
+
+def _bit_size(x: Number) -> int:
+    if isinstance(x, Fraction):
+        return max(x.numerator.bit_length(), x.denominator.bit_length())
+    return 0
+
+
+def _bounded(x: Number) -> Number:
+    """Reject results too large to compute further or print"""
+    if _bit_size(x) > MAX_RESULT_BITS:
+        raise MathError("Result too large")
+    return x
+
+
+def _factorial(x: Number) -> Number:
+    if x != int(x) or x < 0:
+        raise MathError("Factorial needs a non-negative integer")
+    if x > MAX_FACTORIAL:
+        raise MathError("Factorial argument too large")
+    return Fraction(math.factorial(int(x)))
+
+
+def _log(x: Number, base: Optional[Number] = None) -> float:
+    if x <= 0:
+        raise MathError("Logarithm needs a positive number")
+    return math.log(x, base) if base is not None else math.log10(x)
+
+
+def _exact(fn: Callable[[float], float]) -> Callable[[Number], Number]:
+    """Wrap a float-only math function so it accepts exact rationals"""
+    def wrapper(x: Number) -> Number:
+        return fn(float(x))
+    return wrapper
+
+
+FUNCTIONS: Dict[str, Callable[..., Number]] = {
+    "sqrt": _sqrt,
+    "cbrt": _cbrt,
+    "abs": abs,
+    "round": lambda x, n=0: Fraction(round(Fraction(x), int(n))),
+    "floor": lambda x: Fraction(math.floor(x)),
+    "ceil": lambda x: Fraction(math.ceil(x)),
+    "log": _log,
+    "ln": lambda x: _log(x, math.e),
+    "exp": _exact(math.exp),
+    "sin": _exact(math.sin),
+    "cos": _exact(math.cos),
+    "tan": _exact(math.tan),
+    "factorial": _factorial,
+    "min": min,
+    "max": max,
+}
+
+CONSTANTS: Dict[str, Number] = {"pi": math.pi}
+
+
+def _divide(a: Number, b: Number) -> Number:
+    if b == 0:
+        raise MathError("Cannot divide by zero")
+    return a / b
+
+
+def _floordiv(a: Number, b: Number) -> Number:
+    if b == 0:
+        raise MathError("Cannot divide by zero")
+    return Fraction(a // b)
+
+
+def _mod(a: Number, b: Number) -> Number:
+    if b == 0:
+        raise MathError("Cannot divide by zero")
+    return a % b
+
+
+def _power(a: Number, b: Number) -> Number:
+    if abs(b) > MAX_EXPONENT:
+        raise MathError("Exponent too large")
+    if isinstance(b, Fraction) and b.denominator == 1:
+        if a == 0 and b < 0:
+            raise MathError("Cannot divide by zero")
+        # Checked before exponentiating, since computing the power is the slow
+        # part; the estimate is low by under 2x and _bounded catches the rest
+        if abs(int(b)) * (_bit_size(a) - 1) > MAX_RESULT_BITS:
+            raise MathError("Result too large")
+        return a ** int(b)
+    if a < 0:
+        raise MathError("Fractional power of a negative number")
+    return float(a) ** float(b)
+
+
+_BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: _divide,
+    ast.FloorDiv: _floordiv,
+    ast.Mod: _mod,
+    ast.Pow: _power,
+}
+
+_UNARY_OPS = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+
+
+def _eval(node: ast.AST) -> Number:
+    """Evaluate a whitelisted arithmetic AST with exact rational arithmetic"""
+    if isinstance(node, ast.Expression):
+        return _eval(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, Fraction)) and not isinstance(node.value, bool):
+        return _bounded(Fraction(node.value))
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+        return _bounded(_BINARY_OPS[type(node.op)](_eval(node.left), _eval(node.right)))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPS:
+        return _UNARY_OPS[type(node.op)](_eval(node.operand))
+    if isinstance(node, ast.Name) and node.id in CONSTANTS:
+        return CONSTANTS[node.id]
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and node.func.id in FUNCTIONS and not node.keywords):
+        return _bounded(FUNCTIONS[node.func.id](*(_eval(arg) for arg in node.args)))
+    raise MathError(f"Unsupported expression element: {type(node).__name__}")
+
+
+@lru_cache(maxsize=4096)
+def _parse(expression: str) -> ast.Expression:
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise MathError("Expression too long")
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise MathError(f"Invalid expression: {expression}") from e
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, float):
+            # Go through the literal text so 0.1 stays exactly one tenth and
+            # 1e400 is not rounded to infinity
+            literal = Decimal(ast.get_source_segment(expression, node))
+            if abs(literal.as_tuple().exponent) > MAX_EXPONENT:
+                raise MathError("Number too large")
+            node.value = Fraction(literal)
+    return tree
+
+
+def evaluate(expression: str) -> Number:
+    """Safely evaluate an arithmetic expression"""
+    try:
+        return _eval(_parse(expression.replace("^", "**")))
+    except (OverflowError, TypeError, ZeroDivisionError) as e:
+        raise MathError(str(e)) from e
+
+
+def format_number(value: Number) -> str:
+    """Exact decimal for terminating fractions, otherwise 12 significant digits"""
+    try:
+        return _format_number(value)
+    except (ValueError, OverflowError) as e:
+        raise MathError(f"Result cannot be displayed: {e}") from e
+
+
+def _format_number(value: Number) -> str:
+    if isinstance(value, Fraction):
+        if value.denominator == 1:
+            return str(value.numerator)
+        den = value.denominator
+        for p in (2, 5):
+            while den % p == 0:
+                den //= p
+        if den == 1:
+            with localcontext() as ctx:
+                ctx.prec = 50
+                return format(Decimal(value.numerator) / Decimal(value.denominator), "f")
+        value = float(value)
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return f"{value:.12g}"
+
+
+# Word forms rewritten to symbols before extraction
+_NUM = r'-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?'
+_NUM_LIST = rf'{_NUM}(?:\s*(?:,|,?\s*and)\s*{_NUM})+'
+_WORD_FORMS = [
+    (re.compile(rf'\bsum of\s+({_NUM_LIST})'), lambda m: "(" + " + ".join(re.findall(_NUM, m.group(1))) + ")"),
+    (re.compile(rf'\bproduct of\s+({_NUM_LIST})'), lambda m: "(" + " * ".join(re.findall(_NUM, m.group(1))) + ")"),
+    (re.compile(rf'\bdifference (?:of|between)\s+({_NUM})\s*(?:and|,)\s*({_NUM})'), r'(\1 - \2)'),
+    (re.compile(rf'\bquotient of\s+({_NUM})\s*(?:and|by|,)\s*({_NUM})'), r'(\1 / \2)'),
+    (re.compile(rf'\baverage of\s+({_NUM_LIST})'),
+     lambda m: "((" + " + ".join(re.findall(_NUM, m.group(1))) + f") / {len(re.findall(_NUM, m.group(1)))})"),
+    (re.compile(r'\bsquare root of\s+'), 'sqrt '),
+    (re.compile(r'\bcube root of\s+'), 'cbrt '),
+    (re.compile(r'\b(\d+(?:\.\d+)?)\s*%\s*of\s+'), r'(\1 / 100) * '),
+    (re.compile(r'\b(\d+(?:\.\d+)?)\s*%(?!\s*[\d(])'), r'(\1 / 100)'),
+    (re.compile(r'\bto the power of\b'), '**'),
+    (re.compile(r'\bmultiplied by\b|\btimes\b'), '*'),
+    (re.compile(r'\bdivided by\b'), '/'),
+    (re.compile(r'\bplus\b'), '+'),
+    (re.compile(r'\bminus\b'), '-'),
+    (re.compile(r'\bmod(?:ulo)?\b'), '%'),
+    (re.compile(r'\bsquared\b'), '** 2'),
+    (re.compile(r'\bcubed\b'), '** 3'),
+    # "3x4" but not the hex literal "0x10"
+    (re.compile(r'(?<=\d)(?!(?<=\b0)x)\s*[x×]\s*(?=\d)'), ' * '),
+    (re.compile(r'÷'), '/'),
+    (re.compile(r'\^'), '**'),
+]
+
+# "sqrt 16" -> "sqrt(16)" once the word forms above have been applied
+_BARE_FUNCTION = re.compile(rf'\b(sqrt|cbrt)\s+({_NUM}|\([^()]*\))')
+# Numbers glued to letters, underscores or further dots, as in "1_000",
+# "0x10" or "1.2.3", are not arithmetic and must not be read in part
+_NUMBER = r'(?<![\w.])(?:\d+(?:\.\d+)?|\.\d+)(?:[eE][-+]?\d+)?(?!\w|\.\d)'
+
+
+_FUNCTION_NAMES = "|".join(sorted(FUNCTIONS, key=len, reverse=True))
+# Maximal runs of arithmetic tokens inside free text
+_CANDIDATE = re.compile(
+    rf'(?:(?:{_NUMBER}|\b(?:{_FUNCTION_NAMES})\b|\bpi\b|\*\*|[-+*/%(),])\s*)+'
+)
+_HAS_OPERATION = re.compile(rf'\d\s*(?:\*\*|[-+*/%])\s*[\d(.]|\b(?:{_FUNCTION_NAMES})\s*\(|\)\s*(?:\*\*|[-+*/%])')
+
+
+def _normalize(query: str) -> str:
+    text = query.lower()
+    for pattern, replacement in _WORD_FORMS:
+        text = pattern.sub(replacement, text)
+    text = _BARE_FUNCTION.sub(lambda m: f"{m.group(1)}({m.group(2)})", text)
+    return text
+
+
+def _display(expression: str) -> str:
+    """Tidy an extracted expression for output"""
+    return re.sub(r'\s+', ' ', expression).strip()
+
+
+def _trim(candidate: str) -> str:
+    """Drop dangling operators, commas and unmatched parentheses at the edges"""
+    text = candidate.strip().strip(",").strip()
+    text = re.sub(r'[-+*/%(,\s]+$', '', text)
+    text = re.sub(r'^[*/%),\s]+', '', text)
+    while text.count("(") > text.count(")") and text.startswith("("):
+        text = text[1:].lstrip()
+    while text.count(")") > text.count("(") and text.endswith(")"):
+        text = text[:-1].rstrip()
+    return text
+
+
+def solve(query: str) -> Optional[MathResult]:
+    """Find and evaluate the arithmetic expression in a free-text query
+
+    Returns None when the query holds no expression the engine can handle,
+    so the caller can fall back to the LLM. Raises MathError for
+    expressions that are recognised but invalid, such as division by zero.
+    """
+    text = _normalize(query)
+    candidates = sorted((_trim(m.group()) for m in _CANDIDATE.finditer(text)), key=len, reverse=True)
+    error: Optional[MathError] = None
+
+    for candidate in candidates:
+        if not _HAS_OPERATION.search(candidate):
+            continue
+        try:
+            return MathResult(_display(candidate), evaluate(candidate))
+        except MathError as e:
+            # Remember semantic errors, but keep looking if it just didn't parse
+            if not str(e).startswith(("Invalid expression", "Unsupported")):
+                error = error or e
+
+    if error:
+        raise error
+    return None
+
+
+def evaluate_many(expressions: Iterable[str]) -> List[Union[Number, MathError]]:
+    """Evaluate a batch of expressions, sharing work between duplicates
+
+    Errors are returned in place rather than raised so one bad expression
+    does not abort the batch.
+    """
+    results: Dict[str, Union[Number, MathError]] = {}
+    output = []
+    for expression in expressions:
+        if expression not in results:
+            try:
+                results[expression] = evaluate(expression)
+            except MathError as e:
+                results[expression] = e
+        output.append(results[expression])
+    return output
+
+
+def solve_many(queries: Iterable[str]) -> List[Optional[Union[MathResult, MathError]]]:
+    """Batch form of solve(), returning MathError instances in place of raising"""
+    output = []
+    for query in queries:
+        try:
+            output.append(solve(query))
+        except MathError as e:
+            output.append(e)
+    return output
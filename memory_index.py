@@ -0,0 +1,95 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Tuple
+
+# Common English words that carry no retrieval signal
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before
+being below between both but by can could did do does doing down during each few for
+from further had has have having he her here hers herself him himself his how i if in
+into is it its itself just me more most my myself no nor not now of off on once only or
+other our ours ourselves out over own please same she should so some such than that the
+their theirs them themselves then there these they this those through to too under until
+up very was we were what when where which while who whom why will with would you your
+yours yourself yourselves
+""".split())
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords removed"""
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Incrementally maintained inverted index with BM25 ranking"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_lengths: Dict[int, int] = {}
+        self.total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, doc_id: int, text: str):
+        """Index a document under the given id"""
+        terms = Counter(tokenize(text))
+        with self._lock:
+            for term, tf in terms.items():
+                self.postings.setdefault(term, {})[doc_id] = tf
+            length = sum(terms.values())
+            self.doc_lengths[doc_id] = length
+            self.total_length += length
+
+    def remove(self, doc_id: int, text: str):
+        """Drop a previously indexed document"""
+        terms = set(tokenize(text))
+        with self._lock:
+            for term in terms:
+                docs = self.postings.get(term)
+                if docs is not None:
+                    docs.pop(doc_id, None)
+                    if not docs:
+                        del self.postings[term]
+            self.total_length -= self.doc_lengths.pop(doc_id, 0)
+
+    def clear(self):
+        """Remove every document from the index"""
+        with self._lock:
+            self.postings.clear()
+            self.doc_lengths.clear()
+            self.total_length = 0
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[int, float]]:
+        """Return the top-k (doc_id, score) pairs for a query"""
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self.doc_lengths)
+            if not terms or not n_docs:
+                return []
+            avg_length = self.total_length / n_docs or 1.0
+            k1 = self.k1
+            base = k1 * (1 - self.b)
+            slope = k1 * self.b / avg_length
+            doc_lengths = self.doc_lengths
+            scores: Dict[int, float] = {}
+            get_score = scores.get
+            for term in terms:
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                weight = idf * (k1 + 1)
+                for doc_id, tf in docs.items():
+                    scores[doc_id] = get_score(doc_id, 0.0) + weight * tf / (tf + base + slope * doc_lengths[doc_id])
+
+        # Ties go to the most recent document
+        return heapq.nlargest(k, scores.items(), key=lambda item: (item[1], item[0]))
@@ -1,48 +1,228 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple, Union
+import atexit
+from collections import deque
+from itertools import islice
 import json
+import os
+import queue
+import threading
+import time
 from pathlib import Path
 from datetime import datetime
 import logging
 from logger_config import setup_logging
+from memory_index import BM25Index
+from conversation_store import ConversationStore
 
 logger = setup_logging()
 
+# How often journal appends reach the disk: every record, at most once per
+# fsync_interval seconds, or whenever the OS decides
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+class JournalWriter:
+    """One background thread appending every Memory's queued conversations to its journal
+
+    Shared by all memory shards, so the number of writer threads does not
+    grow with the number of sessions.
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, memory: "Memory", conversation: Dict[str, Any]):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="memory-journal", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+        self._queue.put((memory, conversation))
+
+    def flush(self):
+        """Block until everything queued so far, for every shard, has been written"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            memory, conversation = self._queue.get()
+            try:
+                memory._write_queued(conversation)
+            finally:
+                self._queue.task_done()
+
+
+journal_writer = JournalWriter()
+
+
 class Memory:
     """Memory system for storing conversation history and context"""
-    def __init__(self):
-        self.conversations: List[Dict[str, Any]] = []
+    def __init__(self, memory_file: str = "memory.json", fsync_policy: str = "interval",
+                 fsync_interval: float = 1.0, compact_every: int = 200, capacity: int = 10000,
+                 session_id: str = "default", backend: Optional[Any] = None):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"fsync_policy must be one of {FSYNC_POLICIES}, got {fsync_policy!r}")
+        # Bounded in-process history; the oldest turns are evicted at capacity
+        self.conversations = ConversationStore(capacity)
         self.user_preferences: Dict[str, Any] = {}
         self.session_context: Dict[str, Any] = {}
-        self.memory_file = Path("memory.json")
+        self.memory_file = Path(memory_file)
+        self.journal_file = self.memory_file.with_suffix(".journal.jsonl")
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self.session_id = session_id
+        # Optional shared store (e.g. SQLiteMemoryBackend) replacing the
+        # snapshot and journal files below
+        self.backend = backend
+
+        # Guards the in-process history and index; each session shard has its own
+        self._lock = threading.Lock()
+
+        # Inverted index over the retained history; doc ids are record sequence numbers
+        self.index = BM25Index()
+
+        # Appends are handed to the shared journal writer so persistence never
+        # blocks the response; _io_lock serialises all file access
+        self._io_lock = threading.Lock()
+        # Appends of this shard still waiting for the writer
+        self._pending = 0
+        self._pending_cond = threading.Condition()
+        self._journal_entries = 0
+        # Sequence number of the last journal entry written; snapshots record
+        # it so entries they already cover are skipped on replay
+        self._journal_seq = 0
+        self._last_fsync = 0.0
+        # Tail of conversations already in the journal; snapshots are built
+        # from this, never from conversations still waiting in the queue
+        self._durable: deque = deque(maxlen=50)
         self.load_memory()
 
     def save_memory(self):
-        """Save memory to file"""
+        """Write a full snapshot to file and reset the journal"""
+        self.flush()
+        if self.backend is not None:
+            # Every append is already durable in the backend
+            return
+        with self._io_lock:
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        """Atomically replace the snapshot, then truncate the journal it covers"""
         try:
             memory_data = {
-                "conversations": self.conversations[-50:],  # Keep last 50 conversations
+                "conversations": list(self._durable),  # Keep last 50 conversations
                 "user_preferences": self.user_preferences,
-                "session_context": self.session_context
+                "session_context": self.session_context,
+                "journal_seq": self._journal_seq
             }
-            with open(self.memory_file, 'w') as f:
+            tmp_file = self.memory_file.with_suffix(".json.tmp")
+            with open(tmp_file, 'w') as f:
                 json.dump(memory_data, f, indent=2, default=str)
+                f.flush()
+                if self.fsync_policy != "never":
+                    os.fsync(f.fileno())
+            os.replace(tmp_file, self.memory_file)
+            open(self.journal_file, 'w').close()
+            self._journal_entries = 0
             logger.info("Memory saved successfully")
         except Exception as e:
             logger.error(f"Error saving memory: {e}")
 
     def load_memory(self):
-        """Load memory from file"""
+        """Load the memory snapshot from file and replay the journal on top"""
+        if self.backend is not None:
+            try:
+                for conv in self.backend.load(self.session_id, self.conversations.capacity):
+                    self._store(conv)
+                logger.info(f"Memory for session {self.session_id} loaded from {type(self.backend).__name__}")
+            except Exception as e:
+                logger.error(f"Error loading memory: {e}")
+            return
+
+        loaded: List[Dict[str, Any]] = []
+        snapshot_seq = 0
         try:
             if self.memory_file.exists():
                 with open(self.memory_file, 'r') as f:
                     memory_data = json.load(f)
-                    self.conversations = memory_data.get("conversations", [])
+                    loaded = memory_data.get("conversations", [])
                     self.user_preferences = memory_data.get("user_preferences", {})
                     self.session_context = memory_data.get("session_context", {})
+                    snapshot_seq = memory_data.get("journal_seq", 0)
                 logger.info("Memory loaded successfully")
         except Exception as e:
             logger.error(f"Error loading memory: {e}")
 
+        try:
+            if self.journal_file.exists():
+                replayed = 0
+                with open(self.journal_file, 'r') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            # A crash mid-append leaves at most one torn final line
+                            logger.warning("Skipping corrupt memory journal entry")
+                            continue
+                        seq = entry.pop("journal_seq", None)
+                        if seq is not None:
+                            # A crash between writing a snapshot and truncating the
+                            # journal leaves entries the snapshot already holds
+                            if seq <= snapshot_seq:
+                                continue
+                            self._journal_seq = max(self._journal_seq, seq)
+                        loaded.append(entry)
+                        replayed += 1
+                self._journal_entries = replayed
+                logger.info(f"Replayed {replayed} memory journal entries")
+        except Exception as e:
+            logger.error(f"Error replaying memory journal: {e}")
+        self._journal_seq = max(self._journal_seq, snapshot_seq)
+
+        self._durable.extend(loaded)
+        for conv in loaded:
+            self._store(conv)
+
+    def _write_queued(self, conversation: Dict[str, Any]):
+        """Called on the journal writer thread for each queued conversation"""
+        try:
+            with self._io_lock:
+                self._append_journal(conversation)
+                if self._journal_entries >= self.compact_every:
+                    self._write_snapshot()
+        except Exception as e:
+            logger.error(f"Error writing memory journal: {e}")
+        finally:
+            with self._pending_cond:
+                self._pending -= 1
+                self._pending_cond.notify_all()
+
+    def _append_journal(self, conversation: Dict[str, Any]):
+        with open(self.journal_file, 'a') as f:
+            f.write(json.dumps({**conversation, "journal_seq": self._journal_seq + 1}, default=str) + "\n")
+            f.flush()
+            now = time.monotonic()
+            if self.fsync_policy == "always" or (
+                    self.fsync_policy == "interval" and now - self._last_fsync >= self.fsync_interval):
+                os.fsync(f.fileno())
+                self._last_fsync = now
+        self._journal_seq += 1
+        self._journal_entries += 1
+        self._durable.append(conversation)
+
+    def flush(self):
+        """Block until every queued conversation has been written"""
+        if self.backend is not None:
+            self.backend.flush()
+        else:
+            with self._pending_cond:
+                while self._pending:
+                    self._pending_cond.wait()
+
     def add_conversation(self, query: str, response: str, route: str, metadata: Dict[str, Any] = None):
         """Add conversation to memory"""
         conversation = {
@@ -52,27 +232,84 @@ class Memory:
             "route": route,
             "metadata": metadata or {}
         }
-        self.conversations.append(conversation)
-        self.save_memory()
+        with self._lock:
+            self._store(conversation)
+        if self.backend is not None:
+            self.backend.append(self.session_id, conversation)
+        else:
+            with self._pending_cond:
+                self._pending += 1
+            journal_writer.submit(self, conversation)
 
-    def get_context(self, query: str) -> str:
-        """Get relevant context from memory"""
-        relevant_context = []
-        query_lower = query.lower()
+    def _store(self, conversation: Dict[str, Any]):
+        """Add a conversation to the ring buffer and index, dropping any evicted turn"""
+        record, evicted = self.conversations.append(conversation)
+        if evicted is not None:
+            self.index.remove(evicted.seq, self._index_text(evicted))
+        self.index.add(record.seq, self._index_text(record))
 
-        # Look for similar queries in recent conversations
-        for conv in self.conversations[-10:]:  # Check last 10 conversations
-            if any(word in conv['query'].lower() for word in query_lower.split()):
-                relevant_context.append(f"Previous: {conv['query']} -> {conv['response'][:100]}...")
+    @staticmethod
+    def _index_text(record) -> str:
+        return f"{record.query} {record.response}"
+
+    def search(self, query: str, k: int = 3) -> List[Any]:
+        """Get the top-k most relevant past conversation records, ranked with BM25"""
+        with self._lock:
+            records = (self.conversations.get_by_seq(seq) for seq, _ in self.index.search(query, k))
+            return [record for record in records if record is not None]
+
+    def get_context(self, query: str, k: int = 3) -> str:
+        """Get the top-k most relevant past conversations, ranked with BM25"""
+        relevant_context = [f"Previous: {record.query} -> {record.response[:100]}..."
+                            for record in self.search(query, k)]
 
         return "\n".join(relevant_context) if relevant_context else ""
 
+    def get_older_turns(self, keep_recent: int) -> List[Tuple[str, str]]:
+        """(query, route) of every retained turn except the keep_recent newest"""
+        with self._lock:
+            older = max(len(self.conversations) - keep_recent, 0)
+            return [(record.query, record.route)
+                    for record in islice(self.conversations.records(), older)]
+
+    @property
+    def version(self) -> int:
+        """Changes whenever a conversation is added or memory is cleared"""
+        return self.conversations.version
+
+    def get_history(self, cursor: Optional[int] = None, limit: int = 20, route: Optional[str] = None,
+                    since: Optional[Union[str, datetime]] = None,
+                    until: Optional[Union[str, datetime]] = None) -> Dict[str, Any]:
+        """Get one page of conversation history, newest first
+
+        Pass the returned next_cursor back in to fetch the following page.
+        The version lets callers keep a cached page until memory changes.
+        """
+        if isinstance(since, datetime):
+            since = since.isoformat()
+        if isinstance(until, datetime):
+            until = until.isoformat()
+        with self._lock:
+            records, next_cursor = self.conversations.page(cursor, limit, route, since, until)
+            return {
+                "conversations": [{"seq": record.seq, **record.to_dict()} for record in records],
+                "next_cursor": next_cursor,
+                "version": self.version
+            }
+
     def clear_memory(self):
         """Clear all memory"""
-        self.conversations = []
-        self.user_preferences = {}
-        self.session_context = {}
-        self.save_memory()
+        self.flush()
+        with self._io_lock, self._lock:
+            self.conversations.clear()
+            self.user_preferences = {}
+            self.session_context = {}
+            self._durable.clear()
+            self.index.clear()
+            if self.backend is not None:
+                self.backend.clear(self.session_id)
+            else:
+                self._write_snapshot()
         logger.info("Memory cleared successfully")
 
     def get_statistics(self) -> Dict[str, Any]:
@@ -84,17 +321,11 @@ class Memory:
             "last_interaction": None
         }
 
-        if self.conversations:
-            # Calculate route distribution
-            routes = [conv["route"] for conv in self.conversations]
-            for route in set(routes):
-                stats["route_distribution"][route] = routes.count(route)
-
-            # Calculate average response length
-            total_length = sum(len(conv["response"]) for conv in self.conversations)
-            stats["average_response_length"] = total_length / len(self.conversations)
-
-            # Get last interaction time
-            stats["last_interaction"] = self.conversations[-1]["timestamp"]
+        with self._lock:
+            if self.conversations:
+                # Route counts and lengths are kept incrementally by the store
+                stats["route_distribution"] = dict(self.conversations.route_counts)
+                stats["average_response_length"] = self.conversations.total_response_length / len(self.conversations)
+                stats["last_interaction"] = self.conversations.last().timestamp
 
         return stats
\ No newline at end of file
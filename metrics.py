@@ -0,0 +1,209 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from logger_config import current_request_id, setup_logging
+
+logger = setup_logging()
+node_logger = setup_logging(name="nodes")
+
+# Histogram bucket upper bounds in seconds, from sub-millisecond routing up to long generations
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Span list of the request currently being processed, shared by its nodes and branches
+current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Thread-safe store of labelled histograms and counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.help: Dict[str, str] = {}
+
+    def observe(self, name: str, value: float, help_text: str = "", **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+                self.help.setdefault(name, help_text)
+            series[key].observe(value)
+
+    def increment(self, name: str, amount: float = 1.0, help_text: str = "", **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+            self.help.setdefault(name, help_text)
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# HELP {name} {self.help.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in series.items():
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets + (float("inf"),), hist.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_labels(key, le=le)} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(key)} {hist.total}")
+                    lines.append(f"{name}_count{_labels(key)} {hist.count}")
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# HELP {name} {self.help.get(name, '')}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str = "metrics.prom"):
+        """Write the metrics to a file, e.g. for the node_exporter textfile collector"""
+        tmp = Path(path).with_suffix(".tmp")
+        tmp.write_text(self.render_prometheus())
+        tmp.replace(path)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(key: LabelKey, **extra: str) -> str:
+    items = list(key) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def span(name: str, node: str = "", route: str = "") -> Iterator[Dict[str, Any]]:
+    """Time a block, recording it in the histograms and the current request trace
+
+    The yielded dict can be filled in while the span is open (route, tokens,
+    ttft_ms, ...) and is stored as the trace entry.
+    """
+    record: Dict[str, Any] = {"span": name, "node": node, "route": route}
+    trace = current_trace.get()
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception:
+        record["error"] = True
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        record["duration_ms"] = duration * 1000
+        registry.observe("langgraph_span_duration_seconds", duration,
+                         "Duration of graph nodes, LLM calls and memory operations",
+                         span=name, node=record["node"], route=record["route"] or "")
+        if "tokens" in record:
+            registry.increment("langgraph_llm_tokens_total", record["tokens"],
+                               "Tokens generated by LLM calls", node=record["node"], route=record["route"] or "")
+        if "ttft_ms" in record:
+            registry.observe("langgraph_llm_time_to_first_token_seconds", record["ttft_ms"] / 1000,
+                             "Time from LLM request to first streamed token",
+                             node=record["node"], route=record["route"] or "")
+        if "prefill_ms" in record:
+            registry.observe("langgraph_llm_prefill_seconds", record["prefill_ms"] / 1000,
+                             "Time Ollama spent evaluating the prompt",
+                             node=record["node"], route=record["route"] or "",
+                             kv_reuse=str(bool(record.get("kv_reuse"))).lower())
+        if "prefill_saved_tokens" in record:
+            registry.increment("langgraph_llm_prefill_saved_tokens_total", record["prefill_saved_tokens"],
+                               "Context tokens not re-prefilled thanks to KV context reuse",
+                               node=record["node"], route=record["route"] or "")
+        if trace is not None:
+            trace.append(record)
+
+
+def traced_node(name: str, fn):
+    """Wrap a graph node so it runs inside a span and collects its request trace
+
+    The node's trace entries are returned under 'trace', to be appended to
+    the state's. Everything logged while the node runs carries the state's
+    request_id.
+    """
+    def wrapper(state: Dict[str, Any]) -> Dict[str, Any]:
+        trace: List[Dict[str, Any]] = []
+        token = current_trace.set(trace)
+        request_token = current_request_id.set(state.get('request_id') or current_request_id.get())
+        try:
+            with span("node", node=name, route=state.get('route', '')) as record:
+                result = fn(state)
+                record["route"] = result.get('route', record["route"])
+            node_logger.info(f"{name} finished in {record['duration_ms']:.1f} ms",
+                             extra={"node": name, "route": record["route"],
+                                    "duration_ms": round(record["duration_ms"], 1)})
+            result['trace'] = trace
+            return result
+        finally:
+            current_request_id.reset(request_token)
+            current_trace.reset(token)
+
+    wrapper.__name__ = getattr(fn, "__name__", name)
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
+
+
+_server = None
+
+
+def start_metrics_server(port: int = 9464, host: str = "127.0.0.1"):
+    """Serve /metrics in Prometheus text format from a background thread"""
+    global _server
+    if _server is None:
+        # Imported here so processes that never serve metrics don't pay for it
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class _MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any):
+                pass  # Scrapes would otherwise flood stderr
+
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return _server
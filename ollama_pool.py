@@ -0,0 +1,234 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from deadlines import DeadlineExceeded
+from logger_config import setup_logging
+
+logger = setup_logging()
+
+
+class OllamaHost:
+    """Book-keeping for one Ollama daemon in the pool"""
+
+    def __init__(self, url: str, max_concurrency: int):
+        self.url = url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.total_requests = 0
+        self.total_failures = 0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+
+class NoHealthyHostError(RuntimeError):
+    """Raised when no Ollama host could take a request in time"""
+
+
+class OllamaPool:
+    """Load-balanced, connection-pooled access to several Ollama hosts
+
+    Requests go to the healthy host with the fewest outstanding requests,
+    never exceeding a host's concurrency limit. Hosts that fail
+    eject_after times in a row are skipped for eject_seconds.
+    """
+
+    def __init__(self, hosts: List[str], per_host_limit: int = 4, eject_after: int = 3,
+                 eject_seconds: float = 30.0, connect_timeout: float = 5.0,
+                 read_timeout: float = 300.0, acquire_timeout: float = 60.0):
+        if not hosts:
+            raise ValueError("At least one Ollama host is required")
+        self.hosts = [OllamaHost(url, per_host_limit) for url in hosts]
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.timeout = (connect_timeout, read_timeout)
+        self.acquire_timeout = acquire_timeout
+        self._cond = threading.Condition()
+
+        # One keep-alive session for every host, sized to the concurrency limits
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.hosts), pool_maxsize=per_host_limit)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @property
+    def capacity(self) -> int:
+        """Requests the pool can have in flight at once"""
+        return sum(host.max_concurrency for host in self.hosts)
+
+    def acquire(self, prefer: Optional[str] = None, deadline: Optional[float] = None) -> OllamaHost:
+        """Reserve a slot on the least loaded healthy host, waiting if all are busy
+
+        A preferred host URL, e.g. the one holding a session's KV cache, is
+        chosen whenever it is healthy and has a free slot. Running out of the
+        caller's deadline raises DeadlineExceeded, running out of
+        acquire_timeout NoHealthyHostError.
+        """
+        wait_until = time.monotonic() + self.acquire_timeout
+        cut_by_deadline = deadline is not None and deadline < wait_until
+        if cut_by_deadline:
+            wait_until = deadline
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                candidates = [h for h in self.hosts if h.outstanding < h.max_concurrency]
+                healthy = [h for h in candidates if h.healthy(now)]
+                if not healthy and candidates and not any(h.healthy(now) for h in self.hosts):
+                    # Everything is ejected; probe the host that comes back soonest
+                    healthy = [min(candidates, key=lambda h: h.ejected_until)]
+                if healthy:
+                    preferred = [h for h in healthy if h.url == prefer]
+                    host = preferred[0] if preferred else min(healthy, key=lambda h: h.outstanding)
+                    host.outstanding += 1
+                    host.total_requests += 1
+                    return host
+                remaining = wait_until - now
+                if remaining <= 0:
+                    if cut_by_deadline:
+                        raise DeadlineExceeded("No Ollama host became free within the time budget")
+                    raise NoHealthyHostError("Timed out waiting for a free Ollama host")
+                self._cond.wait(remaining)
+
+    def release(self, host: OllamaHost, ok: bool):
+        """Return a slot and update the host's health"""
+        with self._cond:
+            host.outstanding -= 1
+            if ok:
+                host.consecutive_failures = 0
+            else:
+                host.consecutive_failures += 1
+                host.total_failures += 1
+                if host.consecutive_failures >= self.eject_after:
+                    host.ejected_until = time.monotonic() + self.eject_seconds
+                    logger.warning(f"Ejecting Ollama host {host.url} for {self.eject_seconds}s")
+            self._cond.notify()
+
+    def generate(self, payload: Dict[str, Any], prefer: Optional[str] = None,
+                 deadline: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """Stream /api/generate response chunks from the chosen host
+
+        The final chunk also carries the URL of the host that served it. With
+        a monotonic deadline, waiting for a host and for each read from it
+        never goes past the deadline.
+        """
+        host = self.acquire(prefer, deadline)
+        timeout = self.timeout
+        if deadline is not None:
+            timeout = (self.timeout[0], max(min(self.timeout[1], deadline - time.monotonic()), 0.1))
+        ok = False
+        try:
+            with self.session.post(f"{host.url}/api/generate", json={**payload, "stream": True},
+                                   stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise RuntimeError(f"Ollama error from {host.url}: {chunk['error']}")
+                    if chunk.get("done"):
+                        chunk["host"] = host.url
+                        yield chunk
+                        break
+                    yield chunk
+            ok = True
+        except GeneratorExit:
+            # The caller stopped reading early; the host itself was fine
+            ok = True
+            raise
+        except (requests.Timeout, requests.ConnectionError):
+            if deadline is not None and time.monotonic() >= deadline - 0.05:
+                # Cut off by the caller's budget rather than a slow host
+                ok = True
+                raise DeadlineExceeded(f"Ollama host {host.url} did not answer within the time budget")
+            raise
+        except requests.HTTPError as e:
+            # Client errors are the request's fault, not the host's
+            ok = e.response is not None and e.response.status_code < 500
+            raise
+        finally:
+            self.release(host, ok)
+
+    def get_statistics(self) -> List[Dict[str, Any]]:
+        """Per-host load and health"""
+        now = time.monotonic()
+        with self._cond:
+            return [{
+                "url": h.url,
+                "outstanding": h.outstanding,
+                "healthy": h.healthy(now),
+                "total_requests": h.total_requests,
+                "total_failures": h.total_failures
+            } for h in self.hosts]
+
+
+class PooledOllamaLLM:
+    """Drop-in replacement for OllamaLLM that sends requests through an OllamaPool"""
+
+    # Accepts an Ollama conversation context to continue from, and a deadline
+    supports_context = True
+    supports_deadline = True
+
+    def __init__(self, model: str = "mistral", pool: Optional[OllamaPool] = None,
+                 temperature: Optional[float] = None, top_k: Optional[int] = None,
+                 top_p: Optional[float] = None, num_predict: Optional[int] = None,
+                 num_ctx: Optional[int] = None, seed: Optional[int] = None,
+                 keep_alive: Optional[str] = None):
+        self.model = model
+        self.pool = pool or OllamaPool(hosts_from_env())
+        self.temperature = temperature
+        self.top_k = top_k
+        self.top_p = top_p
+        self.num_predict = num_predict
+        self.num_ctx = num_ctx
+        self.seed = seed
+        self.keep_alive = keep_alive
+
+    def _payload(self, prompt: str) -> Dict[str, Any]:
+        options = {name: value for name, value in (
+            ("temperature", self.temperature), ("top_k", self.top_k), ("top_p", self.top_p),
+            ("num_predict", self.num_predict), ("num_ctx", self.num_ctx), ("seed", self.seed)
+        ) if value is not None}
+        payload: Dict[str, Any] = {"model": self.model, "prompt": prompt}
+        if options:
+            payload["options"] = options
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    def stream(self, prompt: str, context: Optional[List[int]] = None,
+               on_done: Optional[Callable[[Dict[str, Any]], None]] = None,
+               prefer_host: Optional[str] = None, deadline: Optional[float] = None,
+               **kwargs: Any) -> Iterator[str]:
+        """Yield response tokens as the host generates them
+
+        context continues a previous generation so its tokens are not
+        prefilled again; on_done receives the final chunk with the new
+        context and the prompt_eval_* timings. deadline is a time.monotonic()
+        value bounding the wait for a host and every read from it.
+        """
+        payload = self._payload(prompt)
+        if context:
+            payload["context"] = context
+        for chunk in self.pool.generate(payload, prefer=prefer_host, deadline=deadline):
+            token = chunk.get("response", "")
+            if token:
+                yield token
+            if chunk.get("done") and on_done is not None:
+                on_done(chunk)
+
+    def invoke(self, prompt: str, **kwargs: Any) -> str:
+        """Return the complete response"""
+        return "".join(self.stream(prompt, **kwargs))
+
+
+def hosts_from_env() -> List[str]:
+    """Ollama hosts from OLLAMA_HOSTS (comma separated), defaulting to the local daemon"""
+    hosts = os.getenv("OLLAMA_HOSTS") or os.getenv("OLLAMA_HOST") or "http://localhost:11434"
+    return [h.strip() if "://" in h else f"http://{h.strip()}" for h in hosts.split(",") if h.strip()]
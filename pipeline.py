@@ -0,0 +1,126 @@
+import re
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, List, Tuple, Optional
+from logger_config import setup_logging
+
+logger = setup_logging()
+
+# End of a sentence followed by whitespace, allowing closing quotes/brackets
+_SENTENCE_END = re.compile(r'[.!?…。！？]["\'”’)\]]*(\s+)')
+
+
+class ChunkSplitter:
+    """Split a token stream into paragraph or sentence sized chunks"""
+
+    def __init__(self, min_chars: int = 200, max_chars: int = 1200):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+
+    def feed(self, token: str) -> List[Tuple[str, str]]:
+        """Add a token, returning any (chunk, separator) pairs now complete"""
+        self.buffer += token
+        chunks = []
+        while True:
+            chunk = self._next_chunk()
+            if chunk is None:
+                break
+            chunks.append(chunk)
+        return chunks
+
+    def flush(self) -> List[Tuple[str, str]]:
+        """Return whatever is left once the stream has ended"""
+        text, self.buffer = self.buffer.strip(), ""
+        return [(text, "")] if text else []
+
+    def _next_chunk(self) -> Optional[Tuple[str, str]]:
+        # Paragraph breaks always end a chunk
+        para = self.buffer.find("\n\n")
+        if para >= 0:
+            end = para
+            while end < len(self.buffer) and self.buffer[end] == "\n":
+                end += 1
+            # Wait for the next character so the full run of newlines is seen
+            if end == len(self.buffer):
+                return None
+            return self._cut(para, end)
+
+        # Otherwise split at the last sentence end once the chunk is big enough
+        if len(self.buffer) >= self.min_chars:
+            last = None
+            for match in _SENTENCE_END.finditer(self.buffer, self.min_chars // 2):
+                last = match
+            if last:
+                return self._cut(last.start(1), last.end())
+
+        # Never let a single chunk grow without bound
+        if len(self.buffer) >= self.max_chars:
+            space = self.buffer.rfind(" ", 0, self.max_chars)
+            cut = space if space > 0 else self.max_chars
+            return self._cut(cut, cut + 1 if space > 0 else cut)
+
+        return None
+
+    def _cut(self, text_end: int, sep_end: int) -> Optional[Tuple[str, str]]:
+        text = self.buffer[:text_end].strip()
+        separator = self.buffer[text_end:sep_end]
+        self.buffer = self.buffer[sep_end:]
+        if not text:
+            return None
+        return text, separator
+
+
+class PipelinedTranslator:
+    """Translate chunks of a streamed text as soon as each one is complete"""
+
+    def __init__(self, translate_fn: Callable[[str], str], max_in_flight: int = 3,
+                 on_chunk: Optional[Callable[[str], None]] = None,
+                 min_chars: int = 200, max_chars: int = 1200):
+        self.translate_fn = translate_fn
+        self.on_chunk = on_chunk
+        self.splitter = ChunkSplitter(min_chars, max_chars)
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="translate")
+        self.pending: List[Tuple[Future, str]] = []
+        self.emitted = 0
+        self.source_parts: List[str] = []
+
+    def submit(self, text: str, separator: str = "\n"):
+        """Queue a standalone piece of text (e.g. a math result) for translation"""
+        self.pending.append((self.executor.submit(self.translate_fn, text), separator))
+
+    def feed(self, token: str):
+        """Feed one streamed token, dispatching any completed chunks"""
+        self.source_parts.append(token)
+        for chunk, separator in self.splitter.feed(token):
+            self.submit(chunk, separator)
+        self._emit_ready()
+
+    def finish(self) -> Tuple[str, str]:
+        """Wait for all chunks and return (source text, translation) in order"""
+        for chunk, separator in self.splitter.flush():
+            self.submit(chunk, separator)
+
+        try:
+            parts = []
+            for future, separator in self.pending:
+                parts.append(future.result().strip() + separator)
+            self._emit_ready()
+        finally:
+            self.executor.shutdown(wait=False)
+
+        logger.info(f"Pipelined translation finished: {len(self.pending)} chunks")
+        return "".join(self.source_parts), "".join(parts).strip()
+
+    def _emit_ready(self):
+        """Report translated chunks in order as soon as their predecessors are done"""
+        if not self.on_chunk:
+            return
+        while self.emitted < len(self.pending) and self.pending[self.emitted][0].done():
+            future, separator = self.pending[self.emitted]
+            self.emitted += 1
+            try:
+                self.on_chunk(future.result().strip() + separator)
+            except Exception:
+                # Failures surface from finish(); just stop emitting here
+                self.emitted -= 1
+                return
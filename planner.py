@@ -0,0 +1,54 @@
+import re
+from typing import Dict, List, Set
+
+# Words that make a later sub-task refer back to an earlier result,
+# e.g. "what is 5+5 and write a story about it"
+_BACK_REFERENCE = re.compile(r'\b(it|its|this|that|them|the result|the answer|the number)\b')
+
+# Literal text to translate, e.g. translate "good morning" or 'good morning'
+QUOTED_TEXT = re.compile(r'''translate\s+(?:"([^"]+)"|'([^']+)')''', re.IGNORECASE)
+
+# Fixed execution order of sub-routes when they depend on each other
+_ORDER = ["math", "write", "translate"]
+
+
+def quoted_text(query: str) -> str:
+    """Return the literal text a query asks to translate, if any"""
+    match = QUOTED_TEXT.search(query)
+    if not match:
+        return ""
+    return match.group(1) or match.group(2)
+
+
+def build_dependencies(query: str, sub_routes: List[str]) -> Dict[str, Set[str]]:
+    """Work out which sub-routes consume the output of which others"""
+    query_lower = query.lower()
+    routes = [r for r in _ORDER if r in sub_routes]
+    deps: Dict[str, Set[str]] = {route: set() for route in routes}
+
+    # The writer only needs the math result when the story refers back to it
+    if 'write' in deps and 'math' in deps:
+        if _BACK_REFERENCE.search(query_lower):
+            deps['write'].add('math')
+
+    # The translator translates earlier outputs unless given literal text
+    if 'translate' in deps and not quoted_text(query):
+        deps['translate'].update(r for r in routes if r != 'translate')
+
+    return deps
+
+
+def plan_stages(query: str, sub_routes: List[str]) -> List[List[str]]:
+    """Group sub-routes into stages that can each run concurrently"""
+    deps = build_dependencies(query, sub_routes)
+    stages: List[List[str]] = []
+    done: Set[str] = set()
+
+    while len(done) < len(deps):
+        stage = [r for r in _ORDER if r in deps and r not in done and deps[r] <= done]
+        if not stage:  # Should not happen with a fixed order, but never loop forever
+            stage = [r for r in _ORDER if r in deps and r not in done]
+        stages.append(stage)
+        done.update(stage)
+
+    return stages
@@ -0,0 +1,125 @@
+import re
+from typing import List, NamedTuple, Optional, Iterable
+
+# Supported translation targets, keyed by the lowercase form used in queries
+LANGUAGES = {
+    'spanish': 'Spanish', 'french': 'French', 'german': 'German',
+    'italian': 'Italian', 'portuguese': 'Portuguese', 'chinese': 'Chinese',
+    'japanese': 'Japanese', 'korean': 'Korean', 'hindi': 'Hindi', 'arabic': 'Arabic'
+}
+
+DEFAULT_LANGUAGE = "Spanish"
+
+_MATH_WORDS = [
+    'calculate', 'compute', 'solve', 'find', 'what is', 'square root',
+    'add', 'subtract', 'multiply', 'divide',
+    'sum', 'difference', 'product', 'quotient'
+]
+_WRITE_WORDS = ['write', 'story', 'poem', 'essay']
+_WRITE_VERBS = ['create', 'compose', 'tell']
+_WRITE_NOUNS = ['tale', 'narrative']
+_TRANSLATE_WORDS = ['translate', 'translation', 'convert']
+
+
+def _alternation(words: Iterable[str]) -> str:
+    """Build a regex alternation, longest words first so prefixes never win"""
+    return "|".join(re.escape(w).replace(r'\ ', r'\s+') for w in sorted(words, key=len, reverse=True))
+
+
+# One combined pattern covering every routing signal. Each alternative is a
+# short keyword-sized atom, so a single finditer pass sees every signal.
+_COMBINED = re.compile(
+    r'\b(?:'
+    rf'(?P<lang_prep>into|to|in)\s+(?P<lang>{_alternation(LANGUAGES)})'
+    rf'|(?P<translate>{_alternation(_TRANSLATE_WORDS)})'
+    rf'|(?P<math>{_alternation(_MATH_WORDS)})'
+    rf'|(?P<write>{_alternation(_WRITE_WORDS)})'
+    rf'|(?P<write_verb>{_alternation(_WRITE_VERBS)})'
+    rf'|(?P<write_noun>{_alternation(_WRITE_NOUNS)})'
+    r')\b'
+    r'|(?P<arith>\d+\s*[\+\-\*\/]\s*\d+)'
+)
+
+
+# Further languages listed after a match, e.g. "to French, German and Japanese"
+_MORE_LANGUAGES = re.compile(rf'\s*(?:,\s*(?:and\s+|or\s+)?|\s+(?:and|or|&)\s+)({_alternation(LANGUAGES)})\b')
+
+
+class RouteResult(NamedTuple):
+    """Routing decision for a single query"""
+    route: str
+    sub_routes: List[str]
+    target_language: Optional[str]  # First of target_languages, kept for single-language callers
+    target_languages: List[str]
+
+
+class Router:
+    """Precompiled single-pass query router"""
+
+    def __init__(self, pattern: re.Pattern = _COMBINED):
+        self.pattern = pattern
+
+    def route(self, query: str) -> RouteResult:
+        """Classify a query into route, sub-routes and target languages"""
+        has_math = has_write = has_translate = False
+        seen_write_verb = False
+        target_languages: List[str] = []
+        text = query.lower()
+
+        for match in self.pattern.finditer(text):
+            kind = match.lastgroup
+            if kind == 'lang':
+                has_translate = True
+                found = [match.group('lang')]
+                end = match.end()
+                while True:
+                    more = _MORE_LANGUAGES.match(text, end)
+                    if not more:
+                        break
+                    found.append(more.group(1))
+                    end = more.end()
+                for name in found:
+                    if LANGUAGES[name] not in target_languages:
+                        target_languages.append(LANGUAGES[name])
+            elif kind == 'translate':
+                has_translate = True
+            elif kind in ('math', 'arith'):
+                has_math = True
+            elif kind == 'write':
+                has_write = True
+            elif kind == 'write_verb':
+                seen_write_verb = True
+            elif kind == 'write_noun' and seen_write_verb:
+                has_write = True
+
+        routes = []
+        if has_math:
+            routes.append("math")
+        if has_write:
+            routes.append("write")
+        if has_translate:
+            routes.append("translate")
+
+        target_language = target_languages[0] if target_languages else None
+        if len(routes) > 1:
+            return RouteResult("multi", routes, target_language, target_languages)
+        if len(routes) == 1:
+            return RouteResult(routes[0], [], target_language, target_languages)
+        return RouteResult("default", [], target_language, target_languages)
+
+    def route_many(self, queries: Iterable[str]) -> List[RouteResult]:
+        """Classify a batch of queries"""
+        route = self.route
+        return [route(query) for query in queries]
+
+    def detect_language(self, query: str) -> Optional[str]:
+        """Return the first target language mentioned in the query"""
+        return self.route(query).target_language
+
+    def detect_languages(self, query: str) -> List[str]:
+        """Return every target language mentioned in the query, in order"""
+        return self.route(query).target_languages
+
+
+# Shared router instance, compiled once at import
+router = Router()
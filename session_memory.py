@@ -0,0 +1,261 @@
+import atexit
+import hashlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from logger_config import setup_logging
+from memory_manager import Memory
+
+logger = setup_logging()
+
+DEFAULT_SESSION = "default"
+
+# "journal": one snapshot + journal file pair per session
+# "sqlite": every session in one SQLite database in WAL mode
+MEMORY_BACKENDS = ("journal", "sqlite")
+
+# Appends committed together in one transaction by the SQLite writer
+WRITE_BATCH = 100
+
+# Session shards kept loaded; the least recently used is flushed and dropped
+# beyond this, and reloaded from storage if its session comes back
+MAX_LOADED_SESSIONS = int(os.getenv("MAX_LOADED_SESSIONS", "256"))
+
+# SQLite durability matching Memory's fsync policies
+_SYNCHRONOUS = {"always": "FULL", "interval": "NORMAL", "never": "OFF"}
+
+
+class SQLiteMemoryBackend:
+    """Conversation storage for every session in a single SQLite database
+
+    Appends are queued and committed in batches by one background thread,
+    so request threads never wait on disk writes. WAL mode lets sessions
+    load their history while the writer is committing.
+    """
+
+    def __init__(self, path: str = "memory/memory.sqlite3", fsync_policy: str = "interval"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.synchronous = _SYNCHRONOUS[fsync_policy]
+        self._queue: "queue.Queue" = queue.Queue()
+        self._read_lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS conversations (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT,
+                   session_id TEXT NOT NULL,
+                   timestamp TEXT,
+                   query TEXT NOT NULL,
+                   response TEXT NOT NULL,
+                   route TEXT NOT NULL,
+                   metadata TEXT
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_session ON conversations (session_id, id)")
+        self._conn.commit()
+        self._writer = threading.Thread(target=self._write_loop, name="memory-sqlite", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        return conn
+
+    def append(self, session_id: str, conversation: Dict[str, Any]):
+        """Queue a conversation for the writer thread"""
+        self._queue.put((session_id, conversation))
+
+    def clear(self, session_id: str):
+        """Queue removal of a session's history, after any appends already queued"""
+        self._queue.put((session_id, None))
+
+    def flush(self):
+        """Block until every queued change has been committed"""
+        self._queue.join()
+
+    def load(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        """The most recent conversations of a session, oldest first"""
+        with self._read_lock:
+            rows = self._conn.execute(
+                "SELECT timestamp, query, response, route, metadata FROM conversations "
+                "WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                (session_id, limit)
+            ).fetchall()
+        return [{
+            "timestamp": timestamp,
+            "query": query,
+            "response": response,
+            "route": route,
+            "metadata": json.loads(metadata) if metadata else {}
+        } for timestamp, query, response, route, metadata in reversed(rows)]
+
+    def sessions(self) -> List[str]:
+        """IDs of every session with stored history"""
+        with self._read_lock:
+            rows = self._conn.execute("SELECT DISTINCT session_id FROM conversations").fetchall()
+        return [row[0] for row in rows]
+
+    def _write_loop(self):
+        """Background thread committing queued changes in batches"""
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with conn:
+                    for session_id, conversation in batch:
+                        if conversation is None:
+                            conn.execute("DELETE FROM conversations WHERE session_id = ?", (session_id,))
+                            continue
+                        conn.execute(
+                            "INSERT INTO conversations (session_id, timestamp, query, response, route, metadata) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (session_id, conversation.get("timestamp"), conversation.get("query", ""),
+                             conversation.get("response", ""), conversation.get("route", ""),
+                             json.dumps(conversation.get("metadata") or {}, default=str))
+                        )
+            except Exception as e:
+                logger.error(f"Error writing memory to SQLite: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+def _file_name(session_id: str) -> str:
+    """Filesystem-safe, collision-free file name for a session ID"""
+    safe = re.sub(r'[^A-Za-z0-9_-]', '_', session_id)[:48]
+    digest = hashlib.sha256(session_id.encode('utf-8')).hexdigest()[:8]
+    return f"{safe}-{digest}.json"
+
+
+class SessionMemory:
+    """Memory shards keyed by session or user ID
+
+    Each shard is a separate Memory with its own lock and storage, so
+    concurrent sessions neither share history nor wait on each other.
+    The default session keeps using memory.json. At most max_sessions
+    shards stay loaded. Shards are loaded and flushed outside the registry
+    lock; a session only waits while its own shard is being loaded or,
+    after eviction, flushed, so one file is never written by two shards.
+    """
+
+    def __init__(self, directory: str = "memory", backend: Optional[str] = None,
+                 capacity: int = 10000, fsync_policy: str = "interval",
+                 max_sessions: int = MAX_LOADED_SESSIONS):
+        backend = backend or os.getenv("MEMORY_BACKEND", "journal")
+        if backend not in MEMORY_BACKENDS:
+            raise ValueError(f"backend must be one of {MEMORY_BACKENDS}, got {backend!r}")
+        self.directory = Path(directory)
+        self.backend = backend
+        self.capacity = capacity
+        self.fsync_policy = fsync_policy
+        self.max_sessions = max_sessions
+        self._shards: "OrderedDict[str, Memory]" = OrderedDict()
+        # Sessions whose shard is being loaded or flushed after eviction; the
+        # event is set once that is done
+        self._busy: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._sqlite: Optional[SQLiteMemoryBackend] = None
+
+    def get(self, session_id: str = DEFAULT_SESSION) -> Memory:
+        """Return the memory shard for a session, loading it on first use"""
+        while True:
+            with self._lock:
+                shard = self._shards.get(session_id)
+                if shard is not None:
+                    self._shards.move_to_end(session_id)
+                    return shard
+                busy = self._busy.get(session_id)
+                if busy is None:
+                    loaded = self._busy[session_id] = threading.Event()
+                    break
+            # Another thread is loading this session, or still flushing it
+            # after eviction; look again once it is done
+            busy.wait()
+
+        try:
+            shard = self._create(session_id)
+        except BaseException:
+            self._done(session_id, loaded)
+            raise
+        with self._lock:
+            # set() may have installed a shard while this one was loading
+            shard = self._shards.setdefault(session_id, shard)
+            self._shards.move_to_end(session_id)
+            # Published and marked loaded together, so no other thread starts a second load
+            if self._busy.get(session_id) is loaded:
+                del self._busy[session_id]
+            evicted = self._evict()
+        loaded.set()
+        self._release(evicted)
+        return shard
+
+    def set(self, session_id: str, memory: Memory):
+        """Replace a session's shard, e.g. with a throwaway store in benchmarks"""
+        with self._lock:
+            self._shards[session_id] = memory
+            self._shards.move_to_end(session_id)
+            evicted = self._evict()
+        self._release(evicted)
+
+    def _evict(self) -> List[Tuple[str, Memory, threading.Event]]:
+        # Called with the registry lock held; evicted sessions stay busy until
+        # _release has flushed them
+        evicted = []
+        while len(self._shards) > self.max_sessions:
+            session_id, shard = self._shards.popitem(last=False)
+            closed = self._busy[session_id] = threading.Event()
+            evicted.append((session_id, shard, closed))
+        return evicted
+
+    def _release(self, evicted: List[Tuple[str, Memory, threading.Event]]):
+        # Outside the registry lock, so other sessions are not held up by the flush
+        for session_id, shard, closed in evicted:
+            try:
+                shard.flush()
+                logger.info(f"Unloaded memory for session {session_id}")
+            finally:
+                self._done(session_id, closed)
+
+    def _done(self, session_id: str, event: threading.Event):
+        with self._lock:
+            if self._busy.get(session_id) is event:
+                del self._busy[session_id]
+        event.set()
+
+    def _create(self, session_id: str) -> Memory:
+        if self.backend == "sqlite":
+            with self._lock:
+                if self._sqlite is None:
+                    self._sqlite = SQLiteMemoryBackend(str(self.directory / "memory.sqlite3"), self.fsync_policy)
+            return Memory(capacity=self.capacity, fsync_policy=self.fsync_policy,
+                          session_id=session_id, backend=self._sqlite)
+
+        if session_id == DEFAULT_SESSION:
+            memory_file = Path("memory.json")
+        else:
+            memory_file = self.directory / "sessions" / _file_name(session_id)
+            memory_file.parent.mkdir(parents=True, exist_ok=True)
+        return Memory(memory_file=str(memory_file), capacity=self.capacity,
+                      fsync_policy=self.fsync_policy, session_id=session_id)
+
+    def session_ids(self) -> List[str]:
+        """IDs of the sessions loaded in this process"""
+        return list(self._shards)
+
+    def flush(self):
+        """Block until every shard's pending writes have reached storage"""
+        for shard in list(self._shards.values()):
+            shard.flush()
@@ -0,0 +1,131 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from deadlines import DeadlineExceeded
+from logger_config import setup_logging
+from metrics import registry
+
+logger = setup_logging()
+
+
+class FlightAbandoned(RuntimeError):
+    """Raised to followers when the leader stopped reading before the stream finished"""
+
+
+class _Flight:
+    """One in-progress execution and everything it has produced so far"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Share one execution between concurrent callers asking for the same key
+
+    The first caller for a key runs the work; callers arriving while it is
+    still running wait for it and receive the same result, or the same
+    stream of items, instead of repeating it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: str) -> Tuple[_Flight, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                registry.increment("langgraph_singleflight_shared_total", 1,
+                                   "Requests served by another caller's in-flight execution", layer=self.name)
+                return flight, False
+            flight = self._flights[key] = _Flight()
+        registry.increment("langgraph_singleflight_executions_total", 1,
+                           "Executions started by the single-flight layer", layer=self.name)
+        return flight, True
+
+    def _finish(self, key: str, flight: _Flight):
+        with self._lock:
+            self._flights.pop(key, None)
+        with flight.cond:
+            flight.done = True
+            flight.cond.notify_all()
+
+    def do(self, key: str, fn: Callable[[], Any], deadline: Optional[float] = None) -> Tuple[Any, bool]:
+        """Return fn()'s result and whether it came from another caller's execution
+
+        A follower waits at most until its own monotonic deadline, then raises
+        DeadlineExceeded. If the leader failed with DeadlineExceeded, that was
+        the leader's budget; a follower with time left runs fn() again.
+        """
+        flight, leader = self._join(key)
+        if leader:
+            try:
+                result = fn()
+                flight.items.append(result)
+                return result, False
+            except BaseException as e:
+                flight.error = e
+                raise
+            finally:
+                self._finish(key, flight)
+
+        with flight.cond:
+            while not flight.done:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise DeadlineExceeded(f"Shared {self.name} execution did not finish within the time budget")
+                flight.cond.wait(remaining)
+        if isinstance(flight.error, DeadlineExceeded) and (deadline is None or time.monotonic() < deadline):
+            logger.info(f"Shared {self.name} execution ran out of its own time budget, running again")
+            return self.do(key, fn, deadline)
+        if flight.error is not None:
+            raise flight.error
+        return flight.items[0], True
+
+    def stream(self, key: str, fn: Callable[[], Iterable[Any]]) -> Tuple[Iterator[Any], bool]:
+        """Return an iterator over fn()'s items and whether it follows another caller
+
+        The leader must consume its iterator, since followers replay what it
+        produces as it goes. If the leader stops early, followers get
+        FlightAbandoned once they have replayed everything it produced.
+        """
+        flight, leader = self._join(key)
+        if leader:
+            return self._lead(key, flight, fn), True
+        return self._follow(flight), False
+
+    def _lead(self, key: str, flight: _Flight, fn: Callable[[], Iterable[Any]]) -> Iterator[Any]:
+        try:
+            for item in fn():
+                with flight.cond:
+                    flight.items.append(item)
+                    flight.cond.notify_all()
+                yield item
+        except GeneratorExit:
+            # The leader stopped reading; followers cannot get the rest
+            flight.error = FlightAbandoned(f"Shared {self.name} execution was abandoned")
+            raise
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._finish(key, flight)
+
+    def _follow(self, flight: _Flight) -> Iterator[Any]:
+        index = 0
+        while True:
+            with flight.cond:
+                while index >= len(flight.items) and not flight.done:
+                    flight.cond.wait()
+                items = flight.items[index:]
+                finished = flight.done
+            index += len(items)
+            yield from items
+            if finished and index >= len(flight.items):
+                break
+        if flight.error is not None:
+            raise flight.error
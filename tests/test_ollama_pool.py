@@ -0,0 +1,172 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from deadlines import DeadlineExceeded
+from ollama_pool import NoHealthyHostError, OllamaPool, PooledOllamaLLM
+
+
+class _StubOllama(BaseHTTPRequestHandler):
+    """Minimal /api/generate: streams two tokens, fails with 500, or stalls"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.hits += 1
+        if self.server.mode == "error":
+            self.send_response(500)
+            self.end_headers()
+            return
+        if self.server.mode == "slow":
+            time.sleep(self.server.delay)
+        self.send_response(200)
+        self.end_headers()
+        for token in ("hello", " world"):
+            self.wfile.write((json.dumps({"response": token, "done": False}) + "\n").encode())
+        self.wfile.write((json.dumps({"response": "", "done": True, "context": [1, 2]}) + "\n").encode())
+
+
+@pytest.fixture
+def stub_hosts():
+    servers = []
+
+    def start(mode: str = "ok", delay: float = 0.0) -> ThreadingHTTPServer:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _StubOllama)
+        server.daemon_threads = True
+        server.mode, server.delay, server.hits = mode, delay, 0
+        server.url = f"http://127.0.0.1:{server.server_port}"
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _generate(pool: OllamaPool, **kwargs) -> list:
+    return list(pool.generate({"model": "stub", "prompt": "hi"}, **kwargs))
+
+
+def test_streams_tokens_and_reports_serving_host(stub_hosts):
+    host = stub_hosts()
+    llm = PooledOllamaLLM(model="stub", pool=OllamaPool([host.url]))
+    done = []
+    assert "".join(llm.stream("hi", on_done=done.append)) == "hello world"
+    assert done[0]["host"] == host.url
+    assert done[0]["context"] == [1, 2]
+
+
+def test_picks_least_outstanding_host(stub_hosts):
+    a, b = stub_hosts(), stub_hosts()
+    pool = OllamaPool([a.url, b.url], per_host_limit=2)
+    first = pool.acquire()
+    second = pool.acquire()
+    assert {first.url, second.url} == {a.url, b.url}
+    pool.release(first, ok=True)
+    third = pool.acquire()
+    assert third.url == first.url
+
+
+def test_prefer_host_when_it_has_a_free_slot(stub_hosts):
+    a, b = stub_hosts(), stub_hosts()
+    pool = OllamaPool([a.url, b.url], per_host_limit=1)
+    assert pool.acquire(prefer=b.url).url == b.url
+    # The preferred host is full, so the other one is used
+    assert pool.acquire(prefer=b.url).url == a.url
+
+
+def test_per_host_limit_blocks_until_timeout(stub_hosts):
+    host = stub_hosts()
+    pool = OllamaPool([host.url], per_host_limit=1, acquire_timeout=0.2)
+    pool.acquire()
+    start = time.monotonic()
+    with pytest.raises(NoHealthyHostError):
+        pool.acquire()
+    assert time.monotonic() - start >= 0.2
+    assert pool.capacity == 1
+
+
+def test_released_slot_wakes_a_waiter(stub_hosts):
+    host = stub_hosts()
+    pool = OllamaPool([host.url], per_host_limit=1, acquire_timeout=2.0)
+    held = pool.acquire()
+    threading.Timer(0.1, pool.release, args=(held, True)).start()
+    assert pool.acquire().url == host.url
+
+
+def test_failing_host_is_ejected_and_recovers(stub_hosts):
+    bad, good = stub_hosts("error"), stub_hosts()
+    pool = OllamaPool([bad.url, good.url], eject_after=2, eject_seconds=0.3)
+
+    failures = 0
+    while bad.hits < 2:
+        try:
+            _generate(pool, prefer=bad.url)
+        except requests.HTTPError:
+            failures += 1
+    assert failures == 2
+    stats = {s["url"]: s for s in pool.get_statistics()}
+    assert not stats[bad.url]["healthy"]
+
+    # While ejected, even requests preferring the bad host go elsewhere
+    assert _generate(pool, prefer=bad.url)[-1]["host"] == good.url
+    assert bad.hits == 2
+
+    time.sleep(0.35)
+    bad.mode = "ok"
+    assert _generate(pool, prefer=bad.url)[-1]["host"] == bad.url
+    stats = {s["url"]: s for s in pool.get_statistics()}
+    assert stats[bad.url]["healthy"]
+
+
+def test_closing_stream_early_is_not_a_host_failure(stub_hosts):
+    host = stub_hosts("error")
+    pool = OllamaPool([host.url], eject_after=3)
+    with pytest.raises(requests.HTTPError):
+        _generate(pool)
+    assert pool.hosts[0].consecutive_failures == 1
+
+    host.mode = "ok"
+    stream = pool.generate({"model": "stub", "prompt": "hi"})
+    next(stream)
+    stream.close()
+    assert pool.hosts[0].consecutive_failures == 0
+    assert pool.hosts[0].outstanding == 0
+
+
+def test_deadline_timeout_is_not_a_host_failure(stub_hosts):
+    host = stub_hosts("slow", delay=1.0)
+    pool = OllamaPool([host.url], eject_after=1)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        _generate(pool, deadline=time.monotonic() + 0.3)
+    assert time.monotonic() - start < 0.9
+    assert pool.hosts[0].consecutive_failures == 0
+    assert pool.hosts[0].healthy(time.monotonic())
+
+
+def test_read_timeout_without_deadline_is_a_host_failure(stub_hosts):
+    host = stub_hosts("slow", delay=1.0)
+    pool = OllamaPool([host.url], eject_after=1, read_timeout=0.3)
+    with pytest.raises(requests.RequestException):
+        _generate(pool)
+    assert pool.hosts[0].consecutive_failures == 1
+    assert not pool.hosts[0].healthy(time.monotonic())
+
+
+def test_deadline_bounds_wait_for_a_free_host(stub_hosts):
+    host = stub_hosts()
+    pool = OllamaPool([host.url], per_host_limit=1, acquire_timeout=5.0)
+    pool.acquire()
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        pool.acquire(deadline=time.monotonic() + 0.2)
+    assert time.monotonic() - start < 1.0